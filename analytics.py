@@ -0,0 +1,124 @@
+"""
+Vectorized statistics over the whole pick history. The picks and bets are loaded once into
+compact NumPy arrays and every statistic is computed from them with array operations, so
+a full recomputation costs a few milliseconds and no per-pick Python objects.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+from sqlalchemy.engine import Connection
+
+NO_PICK = -1  # In PickMatrix.picks and PickMatrix.winning
+
+@dataclass
+class PickMatrix:
+    gambler_ids: np.ndarray  # (g,) int64, sorted
+    names: list[str]  # (g,)
+    bet_ids: np.ndarray  # (b,) int64, sorted
+    picks: np.ndarray  # (g, b) int8: the outcome picked (1, 0 or 2) or NO_PICK
+    odds: np.ndarray  # (b, 3) float64: odds[:, outcome] is the odd of that outcome
+    winning: np.ndarray  # (b,) int8: the result or NO_PICK while unsettled
+    weeks: np.ndarray  # (b,) int32
+    fields: np.ndarray  # (b,) int16 index into field_names
+    field_names: list[str]
+
+    @property
+    def settled(self) -> np.ndarray:
+        return self.winning != NO_PICK
+
+    def gambler_index(self, gambler_id: int) -> int:
+        index = int(np.searchsorted(self.gambler_ids, gambler_id))
+        if index == len(self.gambler_ids) or self.gambler_ids[index] != gambler_id:
+            raise KeyError(f"No gambler with the given ID: {gambler_id}")
+        return index
+
+def rows(connection: Connection, statement: str, parameters: tuple = ()):
+    """
+    Runs `statement` and returns its plain DB-API cursor, which np.fromiter turns into
+    structured rows without ORM overhead. Shared by the NumPy loaders in this module,
+    simulation.py and ratings.py.
+    """
+    return connection.exec_driver_sql(statement, parameters).cursor
+
+def implied_probabilities(odds: np.ndarray) -> np.ndarray:
+    """
+    (m, 3) outcome probabilities from decimal odds with the bookmaker's margin removed by
+    normalizing 1/odd. An odd of 1.0 marks an unavailable outcome (usually the draw) and
+    gets probability 0; a bet with no usable odds at all is treated as a coin toss.
+    """
+    inverse = np.divide(1.0, odds, out=np.zeros(odds.shape), where=odds > 1.0)
+    totals = inverse.sum(axis=1, keepdims=True)
+    return np.divide(inverse, totals, out=np.full(odds.shape, 1 / 3), where=totals > 0)
+
+def load_pick_matrix(connection: Connection) -> PickMatrix:
+    gamblers = connection.exec_driver_sql("SELECT id, name FROM gamblers ORDER BY id").all()
+    gambler_ids = np.fromiter((row[0] for row in gamblers), dtype=np.int64, count=len(gamblers))
+
+    bets = np.fromiter(
+        rows(connection, "SELECT id, odd_0, odd_1, odd_2, COALESCE(winning_odd, -1), week, field FROM bets ORDER BY id"),
+        dtype=[("id", "i8"), ("odd_0", "f8"), ("odd_1", "f8"), ("odd_2", "f8"), ("winning", "i1"), ("week", "i4"), ("field", "U32")],
+    )
+    field_names, fields = np.unique(bets["field"], return_inverse=True)
+
+    picked = np.fromiter(
+        rows(connection, "SELECT gambler_id, bet_id, bet_on FROM gambler_bet"),
+        dtype=[("gambler", "i8"), ("bet", "i8"), ("bet_on", "i1")],
+    )
+    picks = np.full((len(gambler_ids), len(bets)), NO_PICK, dtype=np.int8)
+    picks[np.searchsorted(gambler_ids, picked["gambler"]), np.searchsorted(bets["id"], picked["bet"])] = picked["bet_on"]
+
+    return PickMatrix(
+        gambler_ids=gambler_ids,
+        names=[row[1] for row in gamblers],
+        bet_ids=bets["id"],
+        picks=picks,
+        odds=np.column_stack([bets["odd_0"], bets["odd_1"], bets["odd_2"]]),
+        winning=bets["winning"],
+        weeks=bets["week"],
+        fields=fields.astype(np.int16),
+        field_names=field_names.tolist(),
+    )
+
+@dataclass
+class Stats:
+    """Per-gambler statistics, one row per gambler and one column per group."""
+    labels: list
+    total: np.ndarray  # (g, k) settled picks
+    correct: np.ndarray  # (g, k)
+    payoff: np.ndarray  # (g, k) winnings minus the one-unit stake per pick
+
+    @property
+    def hit_rate(self) -> np.ndarray:
+        return np.divide(self.correct, self.total, out=np.zeros(self.total.shape), where=self.total > 0)
+
+    @property
+    def roi(self) -> np.ndarray:
+        return np.divide(self.payoff, self.total, out=np.zeros(self.total.shape), where=self.total > 0)
+
+def _outcomes(matrix: PickMatrix) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # (g, b) masks of settled and correct picks, and the (b,) odd that paid out
+    played = (matrix.picks != NO_PICK) & matrix.settled
+    correct = played & (matrix.picks == matrix.winning)
+    payout = np.take_along_axis(matrix.odds, matrix.winning.clip(min=0)[:, None].astype(np.intp), axis=1)[:, 0]
+    return played, correct, payout
+
+def _grouped(matrix: PickMatrix, groups: np.ndarray, labels: list) -> Stats:
+    played, correct, payout = _outcomes(matrix)
+    # A (b, k) one-hot matrix turns the per-group sums into three matrix products
+    onehot = np.zeros((len(groups), len(labels)), dtype=np.float64)
+    onehot[np.arange(len(groups)), groups] = 1.0
+    total = played.astype(np.float64) @ onehot
+    wins = correct.astype(np.float64) @ onehot
+    payoff = (correct * payout) @ onehot - total
+    return Stats(labels, total.astype(np.int64), wins.astype(np.int64), payoff)
+
+def gambler_stats(matrix: PickMatrix) -> Stats:
+    """Overall totals; the single column matches the counters stored on the gamblers."""
+    return _grouped(matrix, np.zeros(len(matrix.bet_ids), dtype=np.intp), ["all"])
+
+def stats_by_field(matrix: PickMatrix) -> Stats:
+    return _grouped(matrix, matrix.fields.astype(np.intp), matrix.field_names)
+
+def stats_by_week(matrix: PickMatrix) -> Stats:
+    weeks, groups = np.unique(matrix.weeks, return_inverse=True)
+    return _grouped(matrix, groups, weeks.tolist())
@@ -0,0 +1,203 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import analytics
+import database
+import simulation
+from database import Gambler, Bet, WeeklyStatistics, BetSettlement, LeaderboardMessage
+
+# All SQLite work runs here instead of on the discord.py event loop. A single worker keeps
+# writes in order and avoids "database is locked" errors; raise DB_WORKERS for read-heavy setups.
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("DB_WORKERS", "1")),
+    thread_name_prefix="db",
+)
+
+def _run_in_session(func, *args, **kwargs):
+    # Each task gets a fresh session which is closed (and rolled back if needed) afterwards
+    try:
+        return func(*args, **kwargs)
+    finally:
+        database.session.remove()
+
+async def run(func, *args, **kwargs):
+    """Runs a synchronous `database` function on the DB executor and awaits its result."""
+    loop = asyncio.get_running_loop()
+    call = functools.partial(_run_in_session, func, *args, **kwargs)
+    return await loop.run_in_executor(_executor, call)
+
+def shutdown():
+    _executor.shutdown(wait=True)
+
+class PickBatcher:
+    """
+    Write-behind mode for bet picks. Picks are queued and written by
+    database.link_gamblers_to_bets in one transaction once `max_items` are waiting or
+    `max_delay` seconds after the first one arrived, whichever comes first. Every caller
+    still gets its own comment line or ValueError back.
+    """
+    def __init__(self, max_delay: float = 0.005, max_items: int = 64):
+        self.max_delay = max_delay
+        self.max_items = max_items
+        self.batches = 0
+        self.picks = 0
+        self._pending: list[tuple[dict, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+
+    async def submit(self, **pick) -> str:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((pick, future))
+        if len(self._pending) >= self.max_items:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush_now)
+        return await future
+
+    def _flush_now(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.get_running_loop().create_task(self._write(batch))
+
+    async def _write(self, batch: list[tuple[dict, asyncio.Future]]):
+        self.batches += 1
+        self.picks += len(batch)
+        try:
+            results = await run(database.link_gamblers_to_bets, [pick for pick, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "picks": self.picks,
+            "avg_batch": self.picks / self.batches if self.batches else 0.0,
+        }
+
+# Off by default; set PICK_BATCH_MS to group pick commits during click surges
+pick_batcher: PickBatcher | None = None
+
+def enable_pick_batching(max_delay: float = 0.005, max_items: int = 64):
+    global pick_batcher
+    pick_batcher = PickBatcher(max_delay=max_delay, max_items=max_items)
+
+def disable_pick_batching():
+    global pick_batcher
+    pick_batcher = None
+
+if os.getenv("PICK_BATCH_MS"):
+    enable_pick_batching(max_delay=float(os.getenv("PICK_BATCH_MS")) / 1000)
+
+# Async mirrors of the functions in database.py
+async def add_gambler(discord_id: int, name: str) -> Gambler:
+    return await run(database.add_gambler, discord_id=discord_id, name=name)
+
+async def get_gambler(gambler_dc_id: int) -> Gambler:
+    return await run(database.get_gambler, gambler_dc_id=gambler_dc_id)
+
+async def get_gambler_bet_details(gambler_dc_id: int) -> list[str] | None:
+    return await run(database.get_gambler_bet_details, gambler_dc_id=gambler_dc_id)
+
+async def add_bet(description: dict) -> Bet:
+    return await run(database.add_bet, description)
+
+async def add_bets(descriptions: list[dict]) -> list[Bet]:
+    return await run(database.add_bets, descriptions)
+
+async def link_gambler_to_bet(gambler_id: int, bet_id: int, bet_on: int, skip_timecheck: bool=False) -> str:
+    if pick_batcher:
+        return await pick_batcher.submit(gambler_id=gambler_id, bet_id=bet_id, bet_on=bet_on, skip_timecheck=skip_timecheck)
+    return await run(database.link_gambler_to_bet, gambler_id=gambler_id, bet_id=bet_id, bet_on=bet_on, skip_timecheck=skip_timecheck)
+
+async def get_gambler_bets(gambler_id: int) -> list[Bet] | None:
+    return await run(database.get_gambler_bets, gambler_id=gambler_id)
+
+async def get_bet_gambler_names(bet_id: int) -> list[str]:
+    return await run(database.get_bet_gambler_names, bet_id=bet_id)
+
+async def get_all_gamblers() -> list[Gambler]:
+    return await run(database.get_all_gamblers)
+
+async def get_all_bets() -> list[Bet]:
+    return await run(database.get_all_bets)
+
+async def load_open_bets() -> int:
+    return await run(database.load_open_bets)
+
+async def get_missed_deadlines() -> list[Bet]:
+    return await run(database.get_missed_deadlines)
+
+async def mark_betting_closed(bet_id: int):
+    return await run(database.mark_betting_closed, bet_id=bet_id)
+
+async def load_pick_bitsets() -> int:
+    return await run(database.load_pick_bitsets)
+
+async def search_bets(query: str, status: str = "all", limit: int = 25) -> list[Bet]:
+    return await run(database.search_bets, query=query, status=status, limit=limit)
+
+async def get_all_bets_count() -> int:
+    return await run(database.get_all_bets_count)
+
+async def get_bet(bet_id: int) -> Bet:
+    return await run(database.get_bet, bet_id=bet_id)
+
+async def set_bet_message_id(bet_id: int, message_id: int):
+    return await run(database.set_bet_message_id, bet_id=bet_id, message_id=message_id)
+
+async def set_bet_result(bet_id: int, result: int) -> Bet:
+    return await run(database.set_bet_result, bet_id=bet_id, result=result)
+
+async def settle_bets(results: dict[int, int]) -> list[BetSettlement]:
+    return await run(database.settle_bets, results)
+
+async def resettle_bet(bet_id: int, result: int) -> BetSettlement | None:
+    return await run(database.resettle_bet, bet_id=bet_id, result=result)
+
+async def update_gamblers_on_bet_result(bet_id: int) -> list[str] | None:
+    return await run(database.update_gamblers_on_bet_result, bet_id=bet_id)
+
+async def set_all_gamblers_global_stats(incremental: bool = False):
+    return await run(database.set_all_gamblers_global_stats, incremental=incremental)
+
+async def get_weekly_stats(week_number: int) -> list[WeeklyStatistics]:
+    return await run(database.get_weekly_stats, week_number=week_number)
+
+async def get_pick_matrix() -> analytics.PickMatrix:
+    return await run(database.get_pick_matrix)
+
+async def get_week_state(week_number: int) -> simulation.WeekState:
+    return await run(database.get_week_state, week_number=week_number)
+
+async def get_ratings(limit: int = 20, min_rated: int = 0) -> list:
+    return await run(database.get_ratings, limit=limit, min_rated=min_rated)
+
+async def get_leaderboard(week_number: int) -> list:
+    return await run(database.get_leaderboard, week_number=week_number)
+
+async def get_app_state(name: str) -> str | None:
+    return await run(database.get_app_state, name=name)
+
+async def set_app_state(name: str, value: str):
+    return await run(database.set_app_state, name=name, value=value)
+
+async def get_leaderboard_message(guild_id: int, week: int) -> LeaderboardMessage | None:
+    return await run(database.get_leaderboard_message, guild_id=guild_id, week=week)
+
+async def set_leaderboard_message(guild_id: int, week: int, channel_id: int, message_id: int, content_hash: str):
+    return await run(database.set_leaderboard_message, guild_id=guild_id, week=week, channel_id=channel_id, message_id=message_id, content_hash=content_hash)
+
+async def update_weekly_stats(week_number: int, last_week: int | None = None):
+    return await run(database.update_weekly_stats, week_number=week_number, last_week=last_week)
@@ -0,0 +1,79 @@
+"""Compares bet clicks served by blocking `database` calls against `async_database` under concurrent load.
+
+Run with: python benchmarks/bench_async_db.py
+"""
+import asyncio
+import time
+
+from common import database, seed, percentile
+
+import async_database
+
+GAMBLERS = 300
+OPEN_BETS = 5
+
+
+async def heartbeat(lags: list[float], stop: asyncio.Event, interval: float = 0.001):
+    # Measures how long the event loop is stalled, i.e. how late a gateway heartbeat would run
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - start - interval) * 1000)
+
+
+async def click_blocking(gambler_id: int, bet_id: int, bet_on: int, started: float, acks: list, totals: list):
+    acks.append((time.perf_counter() - started) * 1000)
+    database.get_gambler(gambler_dc_id=gambler_id)
+    database.get_bet(bet_id=bet_id)
+    database.link_gambler_to_bet(gambler_id=gambler_id, bet_id=bet_id, bet_on=bet_on)
+    totals.append((time.perf_counter() - started) * 1000)
+
+
+async def click_async(gambler_id: int, bet_id: int, bet_on: int, started: float, acks: list, totals: list):
+    acks.append((time.perf_counter() - started) * 1000)
+    await async_database.get_gambler(gambler_dc_id=gambler_id)
+    await async_database.get_bet(bet_id=bet_id)
+    await async_database.link_gambler_to_bet(gambler_id=gambler_id, bet_id=bet_id, bet_on=bet_on)
+    totals.append((time.perf_counter() - started) * 1000)
+
+
+async def run_burst(handler, bet_on: int) -> dict:
+    lags, acks, totals = [], [], []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(heartbeat(lags, stop))
+    await asyncio.sleep(0.01)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        handler(1_000 + g, 10_000_000 + g % OPEN_BETS, bet_on, started, acks, totals)
+        for g in range(GAMBLERS)
+    ))
+    elapsed = (time.perf_counter() - started) * 1000
+
+    stop.set()
+    await monitor
+    return {
+        "ack p50": percentile(acks, 50),
+        "ack p99": percentile(acks, 99),
+        "done p99": percentile(totals, 99),
+        "max loop stall": max(lags),
+        "burst total": elapsed,
+    }
+
+
+async def main():
+    seed(n_gamblers=GAMBLERS, n_bets=OPEN_BETS, picks_per_bet=0, settled_ratio=0.0)
+
+    # Each pass changes every pick, so both paths do one write per click
+    blocking = await run_burst(click_blocking, bet_on=1)
+    non_blocking = await run_burst(click_async, bet_on=2)
+
+    print(f"{GAMBLERS} simultaneous bet clicks (ms)")
+    print(f"{'metric':<16}{'blocking':>12}{'async':>12}")
+    for metric in blocking:
+        print(f"{metric:<16}{blocking[metric]:>12.2f}{non_blocking[metric]:>12.2f}")
+    async_database.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
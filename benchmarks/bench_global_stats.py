@@ -0,0 +1,60 @@
+"""Times the global stats resync on a season-sized dataset, full and incremental.
+
+Run with: python benchmarks/bench_global_stats.py
+"""
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+from common import database, seed, timed
+from database import Bet, Gambler, gambler_bet_table
+
+GAMBLERS = 500
+BETS = 400
+PICKS_PER_BET = 250
+
+
+def legacy_resync():
+    # The pre-aggregation loop: one query per gambler and one session.get per pick
+    for gambler in database.session.query(Gambler).all():
+        total, correct, payoff = 0, 0, 0.0
+        stmt = select(gambler_bet_table.c.bet_id, gambler_bet_table.c.bet_on).where(gambler_bet_table.c.gambler_id == gambler.id)
+        for bet_id, bet_on in database.session.execute(stmt).fetchall():
+            bet = database.session.get(Bet, bet_id)
+            if bet.winning_odd is None:
+                continue
+            total += 1
+            if bet_on == bet.winning_odd:
+                correct += 1
+                payoff += bet.odd_1 if bet_on == 1 else bet.odd_0 if bet_on == 0 else bet.odd_2
+            payoff -= 1
+        gambler.correct, gambler.wrong, gambler.total, gambler.payoff = correct, total - correct, total, round(payoff, 2)
+    database.session.commit()
+
+
+def snapshot() -> dict:
+    database.session.remove()
+    return {row.id: (row.correct, row.wrong, row.total, row.payoff) for row in database.session.query(Gambler)}
+
+
+def main():
+    seed(n_gamblers=GAMBLERS, n_bets=BETS, picks_per_bet=PICKS_PER_BET, settled_ratio=0.95)
+    print(f"{GAMBLERS} gamblers, {BETS * PICKS_PER_BET} picks (ms)")
+
+    print(f"legacy loop      {timed(legacy_resync):>9.2f}")
+    expected = snapshot()
+
+    print(f"full aggregate   {timed(database.set_all_gamblers_global_stats, repeat=3):>9.2f}")
+    assert snapshot() == expected, "aggregate resync differs from the legacy loop"
+
+    # Settle one more bet, then resync only the gamblers who played it
+    open_bets = database.session.scalars(select(Bet.id).where(Bet.winning_odd.is_(None)).limit(1)).all()
+    database.session.execute(update(Bet).where(Bet.id.in_(open_bets)).values(deadline=datetime(2020, 1, 1)))
+    database.session.commit()
+    database.settle_bets({bet_id: 1 for bet_id in open_bets})
+    database.session.remove()
+    print(f"incremental      {timed(database.set_all_gamblers_global_stats, incremental=True):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
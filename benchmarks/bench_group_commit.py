@@ -0,0 +1,47 @@
+"""Compares bet pick throughput with one commit per click against PickBatcher group commits.
+
+Run with: python benchmarks/bench_group_commit.py
+"""
+import asyncio
+import time
+
+from common import seed
+
+import async_database
+
+GAMBLERS = 500
+OPEN_BETS = 5
+
+
+async def burst(bet_on: int) -> tuple[float, int]:
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        async_database.link_gambler_to_bet(gambler_id=1_000 + g, bet_id=10_000_000 + g % OPEN_BETS, bet_on=bet_on)
+        for g in range(GAMBLERS)
+    ), return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    return elapsed, sum(isinstance(result, ValueError) for result in results)
+
+
+async def main():
+    seed(n_gamblers=GAMBLERS, n_bets=OPEN_BETS, picks_per_bet=0, settled_ratio=0.0)
+    print(f"{GAMBLERS} simultaneous picks")
+
+    # Every pass changes every pick, so each click is a real write
+    elapsed, _ = await burst(bet_on=1)
+    print(f"commit per click   {GAMBLERS / elapsed:>9.0f} picks/s   {elapsed * 1000:>8.1f} ms")
+
+    async_database.enable_pick_batching(max_delay=0.005, max_items=64)
+    elapsed, _ = await burst(bet_on=2)
+    stats = async_database.pick_batcher.stats()
+    print(f"group commit       {GAMBLERS / elapsed:>9.0f} picks/s   {elapsed * 1000:>8.1f} ms   "
+          f"({stats['batches']} transactions, {stats['avg_batch']:.1f} picks each)")
+
+    # Repeating the same picks must still reject every click individually
+    _, rejected = await burst(bet_on=2)
+    print(f"repeated picks rejected: {rejected}/{GAMBLERS}")
+    async_database.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,65 @@
+"""Shows query plans and timings of the hot queries with and without the migration 3 indexes.
+
+Run with: python benchmarks/bench_indexes.py
+"""
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+from common import database, seed, timed
+import migrations
+
+GAMBLERS = 500
+BETS = 2_000
+PICKS_PER_BET = 100
+WEEKS = 40
+INDEXES = [
+    'ix_gambler_bet_bet', 'ix_bets_week', 'ix_bets_result_deadline',
+    'ix_bets_message_id', 'ix_settlement_log_bet_id', 'ix_weekly_statistics_week_payoff',
+]
+
+QUERIES = {
+    "picks for a bet": ("SELECT gambler_id, bet_on FROM gambler_bet WHERE bet_id = :bet_id", {"bet_id": 10_000_500}),
+    "bets of a week": ("SELECT id FROM bets WHERE week = :week AND winning_odd IS NOT NULL", {"week": 20}),
+    "open bets by deadline": (
+        "SELECT id FROM bets WHERE winning_odd IS NULL AND deadline > :now ORDER BY deadline",
+        {"now": datetime.now(timezone.utc).replace(tzinfo=None)},
+    ),
+    "bet by message": ("SELECT id FROM bets WHERE message_id = :message_id", {"message_id": 500}),
+    "weekly leaderboard": (
+        "SELECT gambler_id, payoff FROM weekly_statistics WHERE week_num = :week ORDER BY payoff DESC",
+        {"week": 20},
+    ),
+}
+
+
+def report(label: str):
+    print(f"--- {label}")
+    connection = database.session.connection()
+    for name, (sql, params) in QUERIES.items():
+        plan = " / ".join(row[-1] for row in connection.execute(text("EXPLAIN QUERY PLAN " + sql), params))
+        elapsed = timed(lambda: connection.execute(text(sql), params).fetchall(), repeat=20)
+        print(f"{name:<24}{elapsed:>8.3f} ms   {plan}")
+    database.session.remove()
+
+
+def main():
+    seed(n_gamblers=GAMBLERS, n_bets=BETS, picks_per_bet=PICKS_PER_BET, weeks=WEEKS, settled_ratio=0.9)
+    database.session.execute(text("UPDATE bets SET message_id = id - 10000000"))
+    database.session.commit()
+    database.update_weekly_stats(1, WEEKS)
+
+    with database.engine.begin() as connection:
+        for name in INDEXES:
+            connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        connection.execute(text("ANALYZE"))
+    report("without indexes")
+
+    with database.engine.begin() as connection:
+        migrations._hot_query_indexes(connection, database.Base.metadata)
+        connection.execute(text("ANALYZE"))
+    report("with indexes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""Times bet autocomplete lookups: the full get_all_bets scan against search_bets.
+
+Run with: python benchmarks/bench_search.py
+"""
+from datetime import datetime
+
+from common import database, seed, timed
+
+BETS = 20_000
+
+
+def legacy_autocomplete(current: str) -> list:
+    # The pre-search_bets handler body: load and sort every bet, filter in Python
+    return [
+        bet for bet in database.get_all_bets()
+        if current.lower() in f"{bet.home_team} {bet.away_team}".lower()
+        and bet.winning_odd is None
+        and bet.deadline > datetime.now()
+    ][:25]
+
+
+def main():
+    seed(n_gamblers=10, n_bets=BETS, picks_per_bet=0, settled_ratio=0.9)
+    print(f"{BETS} bets, 'open' autocomplete per keystroke (ms)")
+    for current in ("", "h", "away", "away 1999"):
+        legacy = timed(legacy_autocomplete, current, repeat=3)
+        indexed = timed(database.search_bets, current, "open", repeat=20)
+        print(f"{current!r:<14} legacy {legacy:>9.2f}   search_bets {indexed:>7.2f}")
+        database.session.remove()
+
+
+if __name__ == "__main__":
+    main()
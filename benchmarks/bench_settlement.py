@@ -0,0 +1,62 @@
+"""Times set-based bet settlement against the old per-gambler loop.
+
+Run with: python benchmarks/bench_settlement.py
+"""
+from datetime import datetime
+
+from common import database, seed, timed
+from sqlalchemy import select, update
+
+from database import Bet, gambler_bet_table
+
+PARTICIPANTS = 300
+MATCHDAY = 20
+
+
+def legacy_settle(bet_id: int):
+    # The pre-settle_bets loop: one get_gambler per participant, mutated in Python
+    bet = database.session.get(Bet, bet_id)
+    stmt = select(gambler_bet_table.c.gambler_id, gambler_bet_table.c.bet_on).where(gambler_bet_table.c.bet_id == bet_id)
+    for gambler_id, bet_on in database.session.execute(stmt).fetchall():
+        gambler = database.get_gambler(gambler_dc_id=gambler_id)
+        if bet_on == bet.winning_odd:
+            gambler.correct += 1
+            gambler.payoff += bet.odd_1 if bet_on == 1 else bet.odd_0 if bet_on == 0 else bet.odd_2
+        else:
+            gambler.wrong += 1
+        gambler.payoff -= 1
+        gambler.total += 1
+    database.session.commit()
+
+
+def reopen(bet_ids: list[int]):
+    database.session.execute(update(Bet).where(Bet.id.in_(bet_ids)).values(winning_odd=None))
+    database.session.commit()
+    database.session.remove()
+
+
+def main():
+    seed(n_gamblers=PARTICIPANTS, n_bets=MATCHDAY, picks_per_bet=PARTICIPANTS)
+    bet_ids = [10_000_000 + i for i in range(MATCHDAY)]
+    database.session.execute(update(Bet).values(deadline=datetime(2020, 1, 1)))
+    database.session.commit()
+
+    def run_legacy(ids):
+        for bet_id in ids:
+            database.session.execute(update(Bet).where(Bet.id == bet_id).values(winning_odd=1))
+            database.session.commit()
+            legacy_settle(bet_id)
+        database.session.remove()
+
+    print(f"{PARTICIPANTS} participants per bet (ms)")
+    for label, ids in (("one bet", bet_ids[:1]), (f"matchday of {MATCHDAY}", bet_ids)):
+        reopen(ids)
+        legacy = timed(run_legacy, ids)
+        reopen(ids)
+        set_based = timed(database.settle_bets, {bet_id: 1 for bet_id in ids})
+        database.session.remove()
+        print(f"{label:<16} legacy {legacy:>9.2f}   settle_bets {set_based:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Times the weekly stats rebuild for one week and for a whole season.
+
+Run with: python benchmarks/bench_weekly_stats.py
+"""
+from sqlalchemy import select
+
+from common import database, seed, timed
+from database import Bet, Gambler, WeeklyStatistics, gambler_bet_table
+
+GAMBLERS = 500
+BETS = 400
+PICKS_PER_BET = 250
+WEEKS = 20
+
+
+def legacy_update(week_number: int):
+    # The pre-window-function rebuild: delete, per-gambler queries, Python ranking
+    database.session.query(WeeklyStatistics).filter(WeeklyStatistics.week_num == week_number).delete()
+    for gambler in database.session.query(Gambler).all():
+        total, correct, payoff = 0, 0, 0.0
+        stmt = (
+            select(gambler_bet_table.c.bet_id, gambler_bet_table.c.bet_on)
+            .join(Bet, Bet.id == gambler_bet_table.c.bet_id)
+            .where(gambler_bet_table.c.gambler_id == gambler.id, Bet.week == week_number)
+        )
+        for bet_id, bet_on in database.session.execute(stmt).fetchall():
+            bet = database.session.get(Bet, bet_id)
+            if bet.winning_odd is None:
+                continue
+            if bet_on == bet.winning_odd:
+                correct += 1
+                payoff += bet.odd_1 if bet_on == 1 else bet.odd_0 if bet_on == 0 else bet.odd_2
+            payoff -= 1
+            total += 1
+        database.session.add(WeeklyStatistics(
+            week_num=week_number, gambler_id=gambler.id, name=gambler.name,
+            payoff=round(payoff, 2), correct=correct, wrong=total - correct, total=total,
+        ))
+    database.session.commit()
+    stats = database.session.query(WeeklyStatistics).filter(WeeklyStatistics.week_num == week_number).order_by(WeeklyStatistics.payoff.desc()).all()
+    for rank, stat in enumerate(stats, start=1):
+        stat.rank = rank
+    database.session.commit()
+
+
+def snapshot() -> dict:
+    database.session.remove()
+    return {
+        (row.week_num, row.gambler_id): (row.payoff, row.correct, row.wrong, row.total)
+        for row in database.session.query(WeeklyStatistics)
+    }
+
+
+def main():
+    seed(n_gamblers=GAMBLERS, n_bets=BETS, picks_per_bet=PICKS_PER_BET, weeks=WEEKS)
+    print(f"{GAMBLERS} gamblers, {BETS * PICKS_PER_BET} picks over {WEEKS} weeks (ms)")
+
+    print(f"legacy, one week       {timed(legacy_update, 1):>9.2f}")
+    expected = snapshot()
+    print(f"window, one week       {timed(database.update_weekly_stats, 1, repeat=3):>9.2f}")
+    assert snapshot() == expected, "window-function rebuild differs from the legacy loop"
+
+    print(f"window, weeks 1..{WEEKS}    {timed(database.update_weekly_stats, 1, WEEKS, repeat=3):>9.2f}")
+    ranks = database.session.execute(
+        select(WeeklyStatistics.rank).where(WeeklyStatistics.week_num == WEEKS).order_by(WeeklyStatistics.payoff.desc())
+    ).scalars().all()
+    assert ranks == sorted(ranks) and ranks[0] == 1 and len(ranks) == GAMBLERS
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+# Benchmarks run against a throwaway SQLite file, never the bot's real database
+_tmpdir = tempfile.mkdtemp(prefix="np_gambling_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from database import Gambler, Bet, gambler_bet_table
+
+
+def seed(n_gamblers: int, n_bets: int, picks_per_bet: int, weeks: int = 10, settled_ratio: float = 1.0, seed: int = 42):
+    """Fills the benchmark database with random gamblers, bets and picks."""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    session = database.session
+
+    session.add_all(Gambler(id=1_000 + i, name=f"gambler_{i}") for i in range(n_gamblers))
+    bets = []
+    for i in range(n_bets):
+        settled = i < n_bets * settled_ratio
+        bets.append(Bet(
+            id=10_000_000 + i,
+            field=rng.choice(["Football", "CS2", "Basketball"]),
+            home_team=f"Home {i}",
+            away_team=f"Away {i}",
+            odd_1=round(rng.uniform(1.1, 4.0), 2),
+            odd_0=round(rng.uniform(2.5, 4.5), 2),
+            odd_2=round(rng.uniform(1.1, 4.0), 2),
+            deadline=now - timedelta(days=1) if settled else now + timedelta(days=1),
+            week=1 + i * weeks // max(n_bets, 1),
+            winning_odd=rng.choice([1, 0, 2]) if settled else None,
+        ))
+    session.add_all(bets)
+    session.commit()
+
+    picks = [
+        {"gambler_id": 1_000 + g, "bet_id": 10_000_000 + b, "bet_on": rng.choice([1, 0, 2])}
+        for b in range(n_bets)
+        for g in rng.sample(range(n_gamblers), min(picks_per_bet, n_gamblers))
+    ]
+    if picks:
+        session.execute(gambler_bet_table.insert(), picks)
+    # Settle the resulted bets through the ledger, as the bot would have
+    settled_ids = [bet.id for bet in bets if bet.winning_odd is not None]
+    if settled_ids:
+        database._append_settlements(settled_ids)
+        database._materialize_ledger()
+        database.ratings.rebuild(session.connection())
+    session.commit()
+    session.remove()
+
+
+def timed(func, *args, repeat: int = 1, **kwargs) -> float:
+    """Returns the best wall time of `repeat` calls in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
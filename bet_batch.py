@@ -0,0 +1,107 @@
+import csv
+import io
+import json
+import math
+import re
+from datetime import datetime, timezone
+
+from settings import Constant, Fields
+
+# Same fields, formats and rules as the /create command
+BATCH_COLUMNS = ["field", "home_team", "away_team", "odd_1", "odd_0", "odd_2", "matchdate", "week"]
+
+def _parse_odd(value) -> float:
+    try:
+        odd = float(str(value).replace(",", "."))
+    except (TypeError, ValueError):
+        raise ValueError(f"odd `{value}` is not a number")
+    if not math.isfinite(odd):
+        raise ValueError(f"odd `{value}` is not a number")
+    if odd < 1:
+        raise ValueError(f"odd `{value}` is smaller than 1.0")
+    return odd
+
+def _parse_week(value) -> int:
+    # JSON gives ints (or true/2.7, which int() would quietly accept), CSV gives strings
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().isdecimal():
+        return int(value.strip())
+    raise ValueError(f"week `{value}` is not a whole number")
+
+def _parse_row(row: dict) -> dict:
+    missing = [column for column in BATCH_COLUMNS if str(row.get(column) or "").strip() == ""]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+
+    field = str(row["field"]).strip()
+    if field not in Fields.ALL_FIELDS:
+        raise ValueError(f"unknown field `{field}`")
+    try:
+        deadline = datetime.strptime(str(row["matchdate"]).strip(), "%Y-%m-%d %H:%M").astimezone(timezone.utc)
+    except ValueError:
+        raise ValueError(f"matchdate `{row['matchdate']}` is not in the YYYY-MM-DD HH:MM format")
+    week = _parse_week(row["week"])
+
+    return {
+        "field": field,
+        "home_team": str(row["home_team"]).strip(),
+        "away_team": str(row["away_team"]).strip(),
+        "odd_1": _parse_odd(row["odd_1"]),
+        "odd_0": _parse_odd(row["odd_0"]),
+        "odd_2": _parse_odd(row["odd_2"]),
+        "deadline": deadline,
+        "week": week,
+    }
+
+def _read_rows(filename: str, data: bytes) -> list[tuple[int, dict]]:
+    text = data.decode("utf-8-sig")
+    if filename.lower().endswith(".json"):
+        rows = json.loads(text)
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError("The JSON file must hold a list of objects.")
+        return list(enumerate(rows, start=1))
+    if filename.lower().endswith(".csv"):
+        reader = csv.DictReader(io.StringIO(text))
+        missing = set(BATCH_COLUMNS) - set(reader.fieldnames or [])
+        if missing:
+            raise ValueError(f"The CSV header is missing: {', '.join(sorted(missing))}")
+        # Line 1 is the header
+        return [(reader.line_num, row) for row in reader]
+    raise ValueError("Attach a .csv or .json file.")
+
+def parse_bet_rows(filename: str, data: bytes) -> tuple[list[tuple[int, dict]], list[str]]:
+    """
+    Reads and validates every row of a CSV or JSON batch of bets before anything is
+    written. Returns the valid rows as (row number, add_bet description) pairs and one
+    error line per invalid row. Raises ValueError if the file itself cannot be read.
+    """
+    valid, errors = [], []
+    for number, row in _read_rows(filename, data):
+        try:
+            valid.append((number, _parse_row(row)))
+        except ValueError as e:
+            errors.append(f"Row {number}: {e}")
+    return valid, errors
+
+def parse_result_pairs(text: str) -> dict[int, int]:
+    """
+    Reads "bet_id:result" pairs separated by spaces or commas ("=" works as well as ":").
+    Raises ValueError naming every pair that cannot be read.
+    """
+    results, errors = {}, []
+    for token in re.split(r"[\s,;]+", text.strip()):
+        if not token:
+            continue
+        match = re.fullmatch(r"(\d+)[:=](\d)", token)
+        if not match or int(match[2]) not in Constant.BET_OUTCOMES:
+            errors.append(f"`{token}` is not a bet_id:result pair with a result of 1, 0 or 2")
+        elif int(match[1]) in results:
+            errors.append(f"bet {match[1]} is given more than once")
+        else:
+            results[int(match[1])] = int(match[2])
+    if errors:
+        raise ValueError("\n".join(errors))
+    if not results:
+        raise ValueError("No results were given.")
+    return results
@@ -1,12 +1,25 @@
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass
 from datetime import datetime, timezone
+import os
 import random
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, Table, Double, DateTime
-from sqlalchemy import event, func, case
+import threading
+from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, Table, Double, DateTime, MetaData
+from sqlalchemy import event, func, case, insert, update, literal, true, Index
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from sqlalchemy.orm import declarative_base, relationship, sessionmaker, scoped_session
 from sqlalchemy import select
 
 from settings import Constant, BetPlaceLines, Emoji
+from migrations import run_migrations
+from open_bets import OpenBetsIndex, PickCounts
+from cache import LRUCache
+from head_to_head import PickBitsets
+import analytics
+import simulation
+import ratings
 
 Base = declarative_base()
 
@@ -15,7 +28,16 @@ gambler_bet_table = Table(
     'gambler_bet', Base.metadata,
     Column('gambler_id', Integer, ForeignKey('gamblers.id'), primary_key=True),
     Column('bet_id', Integer, ForeignKey('bets.id'), primary_key=True),
-    Column('bet_on', Integer)
+    Column('bet_on', Integer),
+    Index('ix_gambler_bet_bet', 'bet_id', 'gambler_id', 'bet_on'),  # Covers "picks for this bet"
+)
+
+# Trigram full-text index over bets, created and kept in sync by migration 5. It lives
+# outside Base.metadata so that create_all never tries to create it as a plain table.
+bets_search_table = Table(
+    'bets_search', MetaData(),
+    Column('rowid', Integer, primary_key=True),
+    Column('bets_search', String),  # FTS5's hidden column named after the table, used for MATCH
 )
 
 class Gambler(Base):
@@ -62,6 +84,12 @@ class Bet(Base):
     winning_odd:Integer = Column(Integer, nullable=True)
     gamblers = relationship('Gambler', secondary=gambler_bet_table, back_populates='bets')
 
+    __table_args__ = (
+        Index('ix_bets_week', 'week', 'winning_odd'),
+        Index('ix_bets_result_deadline', 'winning_odd', 'deadline'),
+        Index('ix_bets_message_id', 'message_id'),
+    )
+
     def __repr__(self):
         return (
             f"{self.home_team} - {self.away_team} | Odds: (1: {self.odd_1:.2f}, 0: {self.odd_0:.2f}, 2: {self.odd_2:.2f}), "
@@ -90,31 +118,229 @@ class WeeklyStatistics(Base):
     wrong = Column(Integer, default=0, nullable=False)  # Wrong bets during the week
     total = Column(Integer, default=0, nullable=False)  # Total bets placed during the week
 
+    __table_args__ = (
+        Index('ix_weekly_statistics_week_gambler', 'week_num', 'gambler_id', unique=True),
+        Index('ix_weekly_statistics_week_payoff', 'week_num', 'payoff'),
+    )
+
     def __repr__(self):
         return (
             f"Week {self.week_num} - {self.name}: "
             f"Payoff: {self.payoff:.2f}, Correct: {self.correct}, Wrong: {self.wrong}, Total: {self.total}"
         )
 
-# Function to generate an 8-digit random number
-def generate_unique_bet_id():
-    while True:
-        random_id = random.randint(10_000_000, 99_999_999)
-        if not session.query(Bet).filter_by(id=random_id).first():
-            return random_id
-        
+class Leaderboard(Base):
+    __tablename__ = 'leaderboard'
+
+    # Global standings, refreshed in place whenever the counters or the bet count change
+    gambler_id = Column(Integer, ForeignKey('gamblers.id'), primary_key=True)
+    name = Column(String, nullable=False)
+    rank = Column(Integer, nullable=True)  # Rank by payoff among eligible gamblers, NULL if not eligible
+    ratio = Column(Double, default=0.0, nullable=False)  # Settled picks per bet created so far
+    payoff = Column(Double, default=0.0, nullable=False)
+    correct = Column(Integer, default=0, nullable=False)
+    wrong = Column(Integer, default=0, nullable=False)
+    total = Column(Integer, default=0, nullable=False)
+
+class Rating(Base):
+    __tablename__ = 'ratings'
+
+    # Skill ratings, moved by every settled pick in the settlement's transaction (see ratings.py)
+    gambler_id = Column(Integer, ForeignKey('gamblers.id'), primary_key=True)
+    rating = Column(Double, nullable=False)
+    deviation = Column(Double, nullable=False)  # Uncertainty of the rating
+    rated = Column(Integer, default=0, nullable=False)  # Settled picks rated so far
+
+class LeaderboardMessage(Base):
+    __tablename__ = 'leaderboard_messages'
+
+    guild_id = Column(Integer, primary_key=True)
+    week = Column(Integer, primary_key=True)
+    channel_id = Column(Integer, nullable=False)
+    message_id = Column(Integer, nullable=False)
+    content_hash = Column(String, nullable=True)  # SHA-256 of the content last posted to the message
+
+class SettlementLog(Base):
+    __tablename__ = 'settlement_log'
+
+    seq = Column(Integer, primary_key=True, autoincrement=True)  # Increases with every settled bet
+    bet_id = Column(Integer, ForeignKey('bets.id'), nullable=False, index=True)
+    settled_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+class SettlementLedger(Base):
+    __tablename__ = 'settlement_ledger'
+
+    # Append-only: rows are never updated or deleted. A corrected result appends reversal
+    # rows (negated counters) followed by the rows of the new result.
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    gambler_id = Column(Integer, ForeignKey('gamblers.id'), nullable=False, index=True)
+    bet_id = Column(Integer, ForeignKey('bets.id'), nullable=False, index=True)
+    week = Column(Integer, nullable=False)
+    bet_on = Column(Integer, nullable=False)
+    winning_odd = Column(Integer, nullable=False)  # The result this row settles or reverses
+    correct = Column(Integer, nullable=False)  # Counter deltas: +1 on settlement, -1 on reversal
+    wrong = Column(Integer, nullable=False)
+    total = Column(Integer, nullable=False)
+    payoff = Column(Double, nullable=False)  # Payoff delta, participation fee included
+    created_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+class Checkpoint(Base):
+    __tablename__ = 'checkpoints'
+
+    name = Column(String, primary_key=True)  # The job that keeps this checkpoint
+    seq = Column(Integer, default=0, nullable=False)  # Last sequence number the job has processed
+
+class AppState(Base):
+    __tablename__ = 'app_state'
+
+    name = Column(String, primary_key=True)  # e.g. "command_tree_hash"
+    value = Column(String, nullable=True)
+
+class ClosedBet(Base):
+    __tablename__ = 'closed_bets'
+
+    bet_id = Column(Integer, ForeignKey('bets.id'), primary_key=True)  # Bet whose announcement buttons were disabled
+    closed_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+class IdSequence(Base):
+    __tablename__ = 'id_sequences'
+
+    name = Column(String, primary_key=True)
+    next_value = Column(Integer, nullable=False)  # First ID that has not been reserved by any process yet
+
+# Bet IDs are what users type in /bet, so they stay 8 digits long
+MIN_BET_ID = 10 ** (Constant.ID_LENGTH - 1)
+MAX_BET_ID = 10 ** Constant.ID_LENGTH - 1
+
+class BetIdAllocator(ABC):
+    """Hands out unused bet IDs. `connection` is the one flushing the new bets."""
+    def allocate(self, connection) -> int:
+        return self.allocate_many(connection, 1)[0]
+
+    @abstractmethod
+    def allocate_many(self, connection, count: int) -> list[int]:
+        ...
+
+    def transaction_ended(self, committed: bool):
+        """Called after every commit or rollback of a session."""
+
+class RandomBetIdAllocator(BetIdAllocator):
+    """The original allocator: random IDs, checked against the bets table one by one."""
+    def allocate_many(self, connection, count: int) -> list[int]:
+        ids: set[int] = set()
+        while len(ids) < count:
+            random_id = random.randint(MIN_BET_ID, MAX_BET_ID)
+            if random_id not in ids and not connection.scalar(select(Bet.id).where(Bet.id == random_id)):
+                ids.add(random_id)
+        return list(ids)
+
+class BlockBetIdAllocator(BetIdAllocator):
+    """
+    Reserves blocks of consecutive IDs by bumping a counter in id_sequences and serves
+    them from memory, so only one insert in `block_size` costs a round trip. Concurrent
+    writers get disjoint blocks. IDs that older random allocations already took inside a
+    new block are skipped.
+
+    The counter is bumped inside the caller's transaction, so a block only belongs to
+    this process once that transaction commits. If it rolls back instead, the IDs left
+    over are dropped: another process may reserve the same block next.
+    """
+    def __init__(self, block_size: int = 100):
+        self.block_size = block_size
+        self._free: deque[int] = deque()
+        self._uncommitted = False  # A block was reserved since the last commit
+        self._lock = threading.Lock()
+
+    def allocate_many(self, connection, count: int) -> list[int]:
+        with self._lock:
+            while len(self._free) < count:
+                self._reserve(connection, max(self.block_size, count - len(self._free)))
+            return [self._free.popleft() for _ in range(count)]
+
+    def _reserve(self, connection, size: int):
+        connection.execute(
+            sqlite_insert(IdSequence)
+            .values(name="bet_id", next_value=MIN_BET_ID)
+            .on_conflict_do_nothing(index_elements=[IdSequence.name])
+        )
+        end = connection.scalar(
+            update(IdSequence)
+            .where(IdSequence.name == "bet_id")
+            .values(next_value=IdSequence.next_value + size)
+            .returning(IdSequence.next_value)
+        )
+        start = end - size
+        if end - 1 > MAX_BET_ID:
+            raise ValueError(f"All {Constant.ID_LENGTH}-digit bet IDs have been used.")
+
+        taken = set(connection.scalars(select(Bet.id).where(Bet.id >= start, Bet.id < end)))
+        self._free.extend(bet_id for bet_id in range(start, end) if bet_id not in taken)
+        self._uncommitted = True
+
+    def transaction_ended(self, committed: bool):
+        with self._lock:
+            if not committed and self._uncommitted:
+                self._free.clear()
+            self._uncommitted = False
+
+bet_id_allocator: BetIdAllocator = BlockBetIdAllocator()
+
+def set_bet_id_allocator(allocator: BetIdAllocator):
+    global bet_id_allocator
+    bet_id_allocator = allocator
+
 @event.listens_for(Bet, "before_insert")
 def set_bet_id(mapper, connection, target):
     if not target.id:
-        target.id = generate_unique_bet_id()
+        target.id = bet_id_allocator.allocate(connection)
 
 # Database Setup
-engine = create_engine('sqlite:///gamblers_bets.db')  # Use SQLite for simplicity
-Base.metadata.create_all(engine)
+engine = create_engine(os.getenv("DATABASE_URL", 'sqlite:///gamblers_bets.db'))  # Use SQLite for simplicity
+run_migrations(engine, Base.metadata)
 
 # Session
-Session = sessionmaker(bind=engine)
-session = Session()
+# Every thread gets its own session, so the DB executor in async_database.py can open
+# a fresh one per task. Objects keep their loaded attributes after commit because they
+# are handed back to the event loop once the task's session is closed.
+Session = sessionmaker(bind=engine, expire_on_commit=False)
+session = scoped_session(Session)
+
+@event.listens_for(Session, "after_commit")
+def _bet_ids_committed(session):
+    bet_id_allocator.transaction_ended(committed=True)
+
+@event.listens_for(Session, "after_rollback")
+def _bet_ids_rolled_back(session):
+    bet_id_allocator.transaction_ended(committed=False)
+
+# Unsettled, not yet started bets, served from memory to autocompletes and bet buttons
+open_bets = OpenBetsIndex()
+pick_counts = PickCounts()
+pick_bitsets = PickBitsets()  # Every gambler's picks, for head-to-head comparisons
+
+# Read-through caches for the gambler and bet lookups every bet click makes. They hold
+# detached objects, so every function that changes those rows invalidates them.
+gambler_cache = LRUCache("gamblers", maxsize=1024, ttl=600)
+bet_cache = LRUCache("bets", maxsize=512, ttl=600)
+
+def _cached(cache: LRUCache, model, key: int):
+    obj = cache.get(key)
+    if obj is None:
+        obj = session.get(model, key)
+        if obj:
+            # Detach it so a later rollback or expire in this session cannot touch the cached copy
+            session.expunge(obj)
+            cache.put(key, obj)
+    return obj
+
+def invalidate_gambler(gambler_id: int):
+    gambler_cache.invalidate(gambler_id)
+
+def invalidate_bet(bet_id: int):
+    bet_cache.invalidate(bet_id)
+
+def cache_stats() -> dict:
+    return {cache.name: cache.stats() for cache in (gambler_cache, bet_cache)}
 
 # Functions for CRUD Operations
 def add_gambler(discord_id: int, name: str):
@@ -126,12 +352,13 @@ def add_gambler(discord_id: int, name: str):
     gambler = Gambler(id=discord_id, name=name)
     session.add(gambler)
     session.commit()
+    invalidate_gambler(discord_id)
     return gambler
 
 def get_gambler(gambler_dc_id: int):
-    gambler = session.get(Gambler, gambler_dc_id)
+    gambler = _cached(gambler_cache, Gambler, gambler_dc_id)
     if gambler:
-        return session.get(Gambler, gambler_dc_id)
+        return gambler
     else:
         raise KeyError(f"No gambler with the given ID: {gambler_dc_id}")
 
@@ -186,15 +413,39 @@ def add_bet(description: dict) -> Bet:
     try:
         bet = Bet(**description)
         session.add(bet)
+        session.flush()
+        _refresh_leaderboard()  # One more bet raises the bar for global eligibility
         session.commit()
+        open_bets.add(bet)
         return bet
     except Exception as e:
         session.rollback()
         print(e)
 
-def link_gambler_to_bet(gambler_id: int, bet_id: int, bet_on: int, skip_timecheck: bool=False):
-    gambler = session.get(Gambler, gambler_id)
-    bet = session.get(Bet, bet_id)
+def add_bets(descriptions: list[dict]) -> list[Bet]:
+    """
+    Creates many bets in one transaction. Their IDs come from one allocate_many call, so
+    the rows go out as a single bulk INSERT.
+    """
+    try:
+        ids = bet_id_allocator.allocate_many(session.connection(), len(descriptions))
+        bets = [Bet(id=bet_id, **description) for bet_id, description in zip(ids, descriptions)]
+        session.add_all(bets)
+        session.flush()
+        _refresh_leaderboard()
+        session.commit()
+        for bet in bets:
+            open_bets.add(bet)
+        return bets
+    except Exception:
+        session.rollback()
+        raise
+
+def _apply_pick(changes: list, gambler_id: int, bet_id: int, bet_on: int, skip_timecheck: bool=False) -> str:
+    # Validates and writes one pick without committing. Raises ValueError before writing anything.
+    # Appends (gambler_id, bet_id, old bet_on, new bet_on) to `changes` for _publish_picks once committed.
+    gambler = _cached(gambler_cache, Gambler, gambler_id)
+    bet = _cached(bet_cache, Bet, bet_id)
 
     if not gambler:
         raise ValueError(f"No gambler found with ID: {gambler_id}")
@@ -224,7 +475,7 @@ def link_gambler_to_bet(gambler_id: int, bet_id: int, bet_on: int, skip_timechec
             (gambler_bet_table.c.bet_id == bet_id)
             )
         session.execute(stmt)
-        session.commit()
+        changes.append((gambler_id, bet_id, result, None))
         return f"{old_bet} olan iddiamı geri çekiyorum çünkü gayım."
     
     if result is not None:
@@ -234,7 +485,7 @@ def link_gambler_to_bet(gambler_id: int, bet_id: int, bet_on: int, skip_timechec
             (gambler_bet_table.c.bet_id == bet_id)
         ).values(bet_on=bet_on)
         session.execute(stmt)
-        session.commit()
+        changes.append((gambler_id, bet_id, result, bet_on))
         iam = BetPlaceLines.getRandomNPProperty()
         return f"{old_bet} olan iddiamı {new_bet} olarak değiştiriyorum çünkü {iam}."
 
@@ -246,7 +497,7 @@ def link_gambler_to_bet(gambler_id: int, bet_id: int, bet_on: int, skip_timechec
             bet_on=bet_on
         )
         session.execute(stmt)
-        session.commit()
+        changes.append((gambler_id, bet_id, None, bet_on))
 
         line = (
             f"{bet.home_team} {BetPlaceLines.getRandomWinClaim()}"
@@ -257,9 +508,52 @@ def link_gambler_to_bet(gambler_id: int, bet_id: int, bet_on: int, skip_timechec
         )
         return line
 
+def _publish_picks(changes: list):
+    # Brings the in-memory pick views up to date with committed picks
+    for gambler_id, bet_id, old_bet_on, new_bet_on in changes:
+        pick_counts.apply(bet_id, old_bet_on, new_bet_on)
+        pick_bitsets.apply(gambler_id, bet_id, old_bet_on, new_bet_on)
+
+def link_gambler_to_bet(gambler_id: int, bet_id: int, bet_on: int, skip_timecheck: bool=False):
+    changes = []
+    line = _apply_pick(changes, gambler_id=gambler_id, bet_id=bet_id, bet_on=bet_on, skip_timecheck=skip_timecheck)
+    session.commit()
+    _publish_picks(changes)
+    return line
+
+def link_gamblers_to_bets(picks: list[dict]) -> list[str | Exception]:
+    """
+    Group commit for link_gambler_to_bet: applies many picks, given as its keyword
+    arguments, in one transaction. Returns each pick's comment line, or the ValueError
+    that rejected it, in order. Rejected picks write nothing, so they do not affect the
+    others; any other error rolls back the whole batch and is raised.
+    """
+    results: list[str | Exception] = []
+    changes = []
+    try:
+        for pick in picks:
+            try:
+                results.append(_apply_pick(changes, **pick))
+            except ValueError as e:
+                results.append(e)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    _publish_picks(changes)
+    return results
+
 def get_gambler_bets(gambler_id: int):
     gambler = session.get(Gambler, gambler_id)
-    return gambler.bets if gambler else None
+    return list(gambler.bets) if gambler else None
+
+def get_bet_gambler_names(bet_id: int) -> list[str]:
+    stmt = (
+        select(Gambler.name)
+        .join(gambler_bet_table, Gambler.id == gambler_bet_table.c.gambler_id)
+        .where(gambler_bet_table.c.bet_id == bet_id)
+    )
+    return list(session.execute(stmt).scalars())
 
 def get_all_gamblers():
     out = session.query(Gambler).all()
@@ -271,12 +565,78 @@ def get_all_bets():
     out.sort()
     return out
 
+def load_open_bets() -> int:
+    """Fills the in-memory open bets index from the database. Returns how many bets are open."""
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    bets = session.scalars(select(Bet).where(Bet.winning_odd.is_(None), Bet.deadline > now))
+    open_bets.load(bets)
+    counts = (
+        select(gambler_bet_table.c.bet_id, gambler_bet_table.c.bet_on, func.count())
+        .join(Bet, Bet.id == gambler_bet_table.c.bet_id)
+        .where(Bet.winning_odd.is_(None), Bet.deadline > now)
+        .group_by(gambler_bet_table.c.bet_id, gambler_bet_table.c.bet_on)
+    )
+    pick_counts.load(session.execute(counts))
+    return len(open_bets)
+
+def get_missed_deadlines() -> list[Bet]:
+    """
+    Unsettled, announced bets whose deadline has passed without their betting being closed,
+    e.g. because the bot was down at the time, oldest first. Bets passed to
+    mark_betting_closed are left out, so a restart does not edit them again.
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    closed = select(ClosedBet.bet_id).where(ClosedBet.bet_id == Bet.id).exists()
+    stmt = select(Bet).where(Bet.winning_odd.is_(None), Bet.message_id.is_not(None), Bet.deadline <= now, ~closed)
+    return list(session.scalars(stmt.order_by(Bet.deadline, Bet.id)))
+
+def mark_betting_closed(bet_id: int):
+    """Records that the bet's announcement no longer takes picks."""
+    session.execute(sqlite_insert(ClosedBet).values(bet_id=bet_id).on_conflict_do_nothing(index_elements=[ClosedBet.bet_id]))
+    session.commit()
+
+def load_pick_bitsets() -> int:
+    """Fills the head-to-head bitsets with every pick and result. Returns how many picks there are."""
+    # Plain DB-API rows: building ORM rows would take longer than building the bitsets
+    connection = session.connection()
+    picks = connection.exec_driver_sql("SELECT gambler_id, bet_id, bet_on FROM gambler_bet").cursor
+    results = connection.exec_driver_sql("SELECT id, winning_odd FROM bets WHERE winning_odd IS NOT NULL").cursor
+    return pick_bitsets.load(picks, results)
+
+def search_bets(query: str, status: str = "all", limit: int = 25) -> list[Bet]:
+    """
+    Returns up to `limit` bets, soonest first, whose teams or field contain every word of
+    `query`. `status` is "open" (no result, not started), "unsettled" (no result) or "all".
+    """
+    stmt = select(Bet)
+    if status not in ("open", "unsettled", "all"):
+        raise ValueError(f"Invalid bet status: {status}")
+    if status in ("open", "unsettled"):
+        stmt = stmt.where(Bet.winning_odd.is_(None))
+    if status == "open":
+        stmt = stmt.where(Bet.deadline > datetime.now(timezone.utc).replace(tzinfo=None))
+
+    # The trigram index only matches words of 3+ characters, shorter ones fall back to LIKE
+    words = query.lower().split()
+    indexed_words = [word for word in words if len(word) >= 3]
+    if indexed_words:
+        phrase = " AND ".join('"' + word.replace('"', '""') + '"' for word in indexed_words)
+        stmt = stmt.where(Bet.id.in_(
+            select(bets_search_table.c.rowid).where(bets_search_table.c.bets_search.match(phrase))
+        ))
+    searchable = func.lower(Bet.home_team + " " + Bet.away_team + " " + Bet.field)
+    for word in words:
+        if len(word) < 3:
+            stmt = stmt.where(searchable.contains(word, autoescape=True))
+
+    return list(session.scalars(stmt.order_by(Bet.deadline).limit(limit)))
+
 def get_all_bets_count() -> int:
     out = session.query(Bet).count()
     return out
 
 def get_bet(bet_id: int):
-    bet = session.get(Bet, bet_id)
+    bet = _cached(bet_cache, Bet, bet_id)
     if bet:
         return bet
     else:
@@ -287,15 +647,13 @@ def set_bet_message_id(bet_id: int, message_id: int):
     if bet:
         bet.message_id = message_id
         session.commit()
+        invalidate_bet(bet_id)
+        open_bets.add(bet)
     else:
         raise KeyError(f"No bet with the given ID: {bet_id}")
     
-def set_bet_result(bet_id: int, result: int):
-    bet = session.get(Bet, bet_id)
-    if not bet:
-        raise KeyError(f"No bet with the given ID: {bet_id}")
-    
-    if bet.winning_odd:
+def _check_result(bet: Bet, result: int):
+    if bet.winning_odd is not None:
         raise ValueError(f"This bet ({bet}) has already resulted: {bet.winning_odd}")
     
     if bet.deadline.astimezone(timezone.utc) > datetime.now(timezone.utc):
@@ -305,111 +663,489 @@ def set_bet_result(bet_id: int, result: int):
     if result not in Constant.BET_OUTCOMES:
         raise ValueError("Invalid result. Result must be one of: 1 (home team wins), 0 (draw), or 2 (away team wins).")
 
+def set_bet_result(bet_id: int, result: int):
+    bet = session.get(Bet, bet_id)
+    if not bet:
+        raise KeyError(f"No bet with the given ID: {bet_id}")
+    _check_result(bet, result)
+
     bet.winning_odd = result
+    _log_settlements([bet.id])
     session.commit()  # Persist the changes in the database
+    invalidate_bet(bet.id)
+    open_bets.discard(bet.id)
+    pick_counts.discard(bet.id)
+    pick_bitsets.settle(bet.id, result)
     return bet
 
-def update_gamblers_on_bet_result(bet_id: int):
-    try:
-        bet = get_bet(bet_id=bet_id)
-    except KeyError as e:
-        raise e
-    
-    result = bet.winning_odd
-
-    # Get all gamblers who bet on this bet
-    stmt = (
-        select(gambler_bet_table.c.gambler_id, gambler_bet_table.c.bet_on)
-        .where(gambler_bet_table.c.bet_id == bet_id)
-    )
-    gambler_bets = session.execute(stmt).fetchall()
-
-    output: list[str] = []
-    if not gambler_bets:
-        print(f"No gamblers placed a bet on: {bet}")
-        return
-
-    # Update each gambler based on their bet outcome
-    for gambler_id, bet_on in gambler_bets:
-        gambler = get_gambler(gambler_dc_id=gambler_id)
-        if not gambler:
-            print(f"Skipping invalid gambler ID: {gambler_id}")
-            continue
-        
-        old_payoff = round(gambler.payoff,2)
-        # Check if the gambler's bet was correct
-        if bet_on == result:
-            result_str = Emoji.CHECK
-            gambler.correct += 1
-            gambler.payoff += bet.odd_1 if result == 1 else bet.odd_0 if result == 0 else bet.odd_2
-        else:
-            result_str = Emoji.X
-            gambler.wrong += 1
-
-        # Subtract participation fee
-        gambler.payoff -= 1
-        # Update total bets
-        gambler.total += 1
-
-        new_payoff = round(gambler.payoff,2)
-        bet_placed = f"{Emoji.ZERO}: Draw ({bet.odd_0})" if bet_on == 0 else f"{Emoji.ONE}: {bet.home_team} ({bet.odd_1})" if bet_on == 1 else f"{Emoji.TWO}: {bet.away_team} ({bet.odd_2})"
-        payoff_status_text = "⤴" if new_payoff > old_payoff else "⤵" if new_payoff < old_payoff else "↔"
-        output.append(f"""
+@dataclass
+class GamblerSettlement:
+    gambler_id: int
+    name: str
+    bet_on: int
+    is_correct: bool
+    old_payoff: float
+    new_payoff: float
+
+@dataclass
+class BetSettlement:
+    bet: Bet
+    gamblers: list[GamblerSettlement]
+
+    def lines(self) -> list[str]:
+        """Per-gambler lines of the match result announcement."""
+        bet = self.bet
+        output: list[str] = []
+        for gambler in self.gamblers:
+            result_str = Emoji.CHECK if gambler.is_correct else Emoji.X
+            old_payoff = round(gambler.old_payoff, 2)
+            new_payoff = round(gambler.new_payoff, 2)
+            bet_placed = f"{Emoji.ZERO}: Draw ({bet.odd_0})" if gambler.bet_on == 0 else f"{Emoji.ONE}: {bet.home_team} ({bet.odd_1})" if gambler.bet_on == 1 else f"{Emoji.TWO}: {bet.away_team} ({bet.odd_2})"
+            payoff_status_text = "⤴" if new_payoff > old_payoff else "⤵" if new_payoff < old_payoff else "↔"
+            output.append(f"""
             **{gambler.name}** {result_str}
         Bet: {bet_placed}
         Payoff: {old_payoff} {payoff_status_text} {new_payoff}
         """)
-    # Commit updates to gamblers
-    session.commit()
-    return output
-
-def set_all_gamblers_global_stats():
-    # Fetch all gamblers
-    gamblers = session.query(Gambler).all()
-
-    for gambler in gamblers:
-        # Initialize stats
-        total_bets = 0
-        correct_bets = 0
-        wrong_bets = 0
-        total_payoff = 0.0
-
-        # Fetch all bets placed by this gambler
-        stmt = (
-            select(gambler_bet_table.c.bet_id, gambler_bet_table.c.bet_on)
-            .join(Bet, Bet.id == gambler_bet_table.c.bet_id)
-            .where(gambler_bet_table.c.gambler_id == gambler.id)
+        return output
+
+def _winning_odd_payout():
+    # Odd paid out for a pick, 0 for a wrong one. The participation fee is not included.
+    return case(
+        (gambler_bet_table.c.bet_on != Bet.winning_odd, 0.0),
+        (Bet.winning_odd == 1, Bet.odd_1),
+        (Bet.winning_odd == 0, Bet.odd_0),
+        else_=Bet.odd_2,
+    )
+
+def _settled_picks():
+    """Picks on resulted bets as settlement_ledger rows, in LEDGER_COLUMNS order."""
+    correct = case((gambler_bet_table.c.bet_on == Bet.winning_odd, 1), else_=0)
+    return (
+        select(
+            gambler_bet_table.c.gambler_id,
+            gambler_bet_table.c.bet_id,
+            Bet.week,
+            gambler_bet_table.c.bet_on,
+            Bet.winning_odd,
+            correct.label("correct"),
+            (1 - correct).label("wrong"),
+            literal(1).label("total"),
+            (_winning_odd_payout() - 1).label("payoff"),
         )
-        gambler_bets = session.execute(stmt).fetchall()
+        .join(Bet, Bet.id == gambler_bet_table.c.bet_id)
+        .where(Bet.winning_odd.is_not(None))
+    )
 
-        for bet_id, bet_on in gambler_bets:
-            bet = session.get(Bet, bet_id)
+LEDGER_COLUMNS = ["gambler_id", "bet_id", "week", "bet_on", "winning_odd", "correct", "wrong", "total", "payoff"]
+
+def _net_ledger(*criteria):
+    """Net counters per gambler and week of the ledger rows matching `criteria`."""
+    ledger = SettlementLedger
+    return (
+        select(
+            ledger.week,
+            ledger.gambler_id,
+            func.sum(ledger.correct).label("correct"),
+            func.sum(ledger.wrong).label("wrong"),
+            func.sum(ledger.total).label("total"),
+            func.sum(ledger.payoff).label("payoff"),
+        )
+        .where(*criteria)
+        .group_by(ledger.week, ledger.gambler_id)
+    )
+
+def _append_settlements(bet_ids: list[int]) -> list:
+    # Bets that still have a live settlement in the ledger are skipped, which makes this idempotent
+    settled = (
+        select(SettlementLedger.bet_id)
+        .where(SettlementLedger.bet_id.in_(bet_ids))
+        .group_by(SettlementLedger.bet_id)
+        .having(func.sum(SettlementLedger.total) != 0)
+    )
+    rows = _settled_picks().where(
+        gambler_bet_table.c.bet_id.in_(bet_ids),
+        gambler_bet_table.c.bet_id.not_in(settled),
+    )
+    stmt = (
+        insert(SettlementLedger)
+        .from_select(LEDGER_COLUMNS, rows)
+        .returning(SettlementLedger.seq, SettlementLedger.gambler_id, SettlementLedger.bet_id, SettlementLedger.bet_on, SettlementLedger.correct, SettlementLedger.payoff)
+    )
+    return session.execute(stmt).fetchall()
 
-            if not bet or bet.winning_odd is None:
-                continue  # Skip bets without results
+def _append_reversals(bet: Bet) -> list:
+    # Negates whatever the ledger currently credits for this bet, gambler by gambler
+    ledger = SettlementLedger
+    rows = (
+        select(
+            ledger.gambler_id,
+            ledger.bet_id,
+            ledger.week,
+            func.max(ledger.bet_on),
+            literal(bet.winning_odd),
+            -func.sum(ledger.correct),
+            -func.sum(ledger.wrong),
+            -func.sum(ledger.total),
+            -func.sum(ledger.payoff),
+        )
+        .where(ledger.bet_id == bet.id)
+        .group_by(ledger.gambler_id, ledger.bet_id, ledger.week)
+        .having(func.sum(ledger.total) != 0)
+    )
+    stmt = (
+        insert(SettlementLedger)
+        .from_select(LEDGER_COLUMNS, rows)
+        .returning(SettlementLedger.gambler_id, SettlementLedger.payoff)
+    )
+    return session.execute(stmt).fetchall()
+
+def _rank_weeks(weeks: set[int]):
+    # Gives every gambler a row in the weeks (like update_weekly_stats does) and re-ranks them
+    weeks = sorted(weeks)
+    missing = (
+        select(Bet.week.distinct(), Gambler.id, Gambler.name)
+        .join(Gambler, true())
+        .where(Bet.week.in_(weeks))
+    )
+    session.execute(
+        sqlite_insert(WeeklyStatistics)
+        .from_select(["week_num", "gambler_id", "name"], missing)
+        .on_conflict_do_nothing(index_elements=[WeeklyStatistics.week_num, WeeklyStatistics.gambler_id])
+    )
+    ranks = (
+        select(
+            WeeklyStatistics.id,
+            func.rank().over(partition_by=WeeklyStatistics.week_num, order_by=WeeklyStatistics.payoff.desc()).label("rank"),
+        )
+        .where(WeeklyStatistics.week_num.in_(weeks))
+        .subquery()
+    )
+    session.execute(
+        update(WeeklyStatistics)
+        .where(WeeklyStatistics.id == ranks.c.id)
+        .values(rank=ranks.c.rank)
+        .execution_options(synchronize_session=False)
+    )
 
-            total_bets += 1
+def _refresh_leaderboard():
+    """
+    Recomputes every gambler's global standing from the stored counters with one
+    INSERT ... SELECT. Costs O(gamblers) however many weeks are stored. Does not commit.
+    """
+    bets_count = select(func.count(Bet.id)).scalar_subquery()
+    total = func.coalesce(Gambler.total, 0)
+    ratio = func.coalesce(total * 1.0 / func.nullif(bets_count, 0), 0.0)
+    standings = select(
+        Gambler.id,
+        Gambler.name,
+        ratio.label("ratio"),
+        (ratio > Constant.LEADERBOARD_MIN_RATIO).label("eligible"),
+        func.coalesce(Gambler.payoff, 0.0).label("payoff"),
+        func.coalesce(Gambler.correct, 0).label("correct"),
+        func.coalesce(Gambler.wrong, 0).label("wrong"),
+        total.label("total"),
+    ).subquery()
+    rank = func.rank().over(partition_by=standings.c.eligible, order_by=standings.c.payoff.desc())
+    ranked = select(
+        standings.c.id,
+        standings.c.name,
+        case((standings.c.eligible, rank)),
+        standings.c.ratio,
+        standings.c.payoff,
+        standings.c.correct,
+        standings.c.wrong,
+        standings.c.total,
+    ).where(true())  # SQLite needs a WHERE before ON CONFLICT in an INSERT ... SELECT
+    columns = ["gambler_id", "name", "rank", "ratio", "payoff", "correct", "wrong", "total"]
+    stmt = sqlite_insert(Leaderboard).from_select(columns, ranked)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Leaderboard.gambler_id],
+        set_={column: stmt.excluded[column] for column in columns[1:]},
+    )
+    session.execute(stmt)
+
+def _materialize_ledger() -> set[int]:
+    """
+    Applies the ledger rows added since the last call to the gamblers' counters and to
+    weekly_statistics, then re-ranks the weeks they touched. Costs O(new rows), not
+    O(history). Returns the touched weeks. Does not commit.
+    """
+    checkpoint = session.get(Checkpoint, "ledger")
+    if not checkpoint:
+        checkpoint = Checkpoint(name="ledger", seq=0)
+        session.add(checkpoint)
+    last_seq = session.scalar(select(func.max(SettlementLedger.seq))) or 0
+    if last_seq <= checkpoint.seq:
+        return set()
+    new_rows = (SettlementLedger.seq > checkpoint.seq, SettlementLedger.seq <= last_seq)
+
+    weekly = _net_ledger(*new_rows).subquery()
+    per_gambler = (
+        select(
+            weekly.c.gambler_id,
+            func.sum(weekly.c.correct).label("correct"),
+            func.sum(weekly.c.wrong).label("wrong"),
+            func.sum(weekly.c.total).label("total"),
+            func.sum(weekly.c.payoff).label("payoff"),
+        )
+        .group_by(weekly.c.gambler_id)
+        .subquery()
+    )
+    session.execute(
+        update(Gambler)
+        .where(Gambler.id == per_gambler.c.gambler_id)
+        .values(
+            correct=Gambler.correct + per_gambler.c.correct,
+            wrong=Gambler.wrong + per_gambler.c.wrong,
+            total=Gambler.total + per_gambler.c.total,
+            payoff=func.round(Gambler.payoff + per_gambler.c.payoff, 2),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+    deltas = (
+        # Rounded like update_weekly_stats rounds, so new rows rank the same as rebuilt ones
+        select(weekly.c.week, weekly.c.gambler_id, Gambler.name, weekly.c.correct, weekly.c.wrong, weekly.c.total, func.round(weekly.c.payoff, 2))
+        .join(Gambler, Gambler.id == weekly.c.gambler_id)
+        .where(true())  # SQLite needs a WHERE before ON CONFLICT in an INSERT ... SELECT
+    )
+    stmt = sqlite_insert(WeeklyStatistics).from_select(
+        ["week_num", "gambler_id", "name", "correct", "wrong", "total", "payoff"],
+        deltas,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[WeeklyStatistics.week_num, WeeklyStatistics.gambler_id],
+        set_={
+            "correct": WeeklyStatistics.correct + stmt.excluded.correct,
+            "wrong": WeeklyStatistics.wrong + stmt.excluded.wrong,
+            "total": WeeklyStatistics.total + stmt.excluded.total,
+            "payoff": func.round(WeeklyStatistics.payoff + stmt.excluded.payoff, 2),
+        },
+    )
+    session.execute(stmt)
+
+    weeks = set(session.scalars(select(SettlementLedger.week.distinct()).where(*new_rows)))
+    _rank_weeks(weeks)
+    _refresh_leaderboard()
+    checkpoint.seq = last_seq
+    _invalidate_gamblers()
+    return weeks
+
+def _log_settlements(bet_ids: list[int]):
+    session.add_all(SettlementLog(bet_id=bet_id) for bet_id in bet_ids)
+
+def _invalidate_gamblers():
+    # Set-based updates bypass the ORM, so drop any stale counters held by this session or the cache
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, Gambler):
+            session.expire(obj)
+    gambler_cache.clear()
+
+def _rate_settlements(rows: list):
+    # Moves each participant's rating by their newly settled picks: O(participants)
+    if not rows:
+        return
+    odds = {
+        bet_id: (odd_0, odd_1, odd_2)
+        for bet_id, odd_0, odd_1, odd_2 in session.execute(
+            select(Bet.id, Bet.odd_0, Bet.odd_1, Bet.odd_2).where(Bet.id.in_({row.bet_id for row in rows}))
+        )
+    }
+    picks = ratings.rated_picks(
+        [row.gambler_id for row in rows],
+        [row.seq for row in rows],
+        [odds[row.bet_id] for row in rows],
+        [row.bet_on for row in rows],
+        [row.correct for row in rows],
+    )
+    current = {
+        gambler_id: (rating, deviation, rated)
+        for gambler_id, rating, deviation, rated in session.execute(
+            select(Rating.gambler_id, Rating.rating, Rating.deviation, Rating.rated)
+            .where(Rating.gambler_id.in_({row.gambler_id for row in rows}))
+        )
+    }
+    stmt = sqlite_insert(Rating)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Rating.gambler_id],
+        set_={column: stmt.excluded[column] for column in ("rating", "deviation", "rated")},
+    )
+    session.execute(stmt, [
+        {"gambler_id": gambler_id, "rating": rating, "deviation": deviation, "rated": rated}
+        for gambler_id, (rating, deviation, rated) in ratings.apply(current, picks).items()
+    ])
+
+def _payoffs_before(gambler_ids) -> dict[int, tuple[str, float]]:
+    stmt = select(Gambler.id, Gambler.name, Gambler.payoff).where(Gambler.id.in_(set(gambler_ids)))
+    return {gambler_id: (name, payoff or 0.0) for gambler_id, name, payoff in session.execute(stmt)}
+
+def _apply_settlements(bets: list[Bet]) -> list[BetSettlement]:
+    """
+    Appends one settlement_ledger row per participant of the given resulted bets with a
+    single INSERT ... SELECT, then materializes them into the gamblers' counters and the
+    weekly stats. Bets that are already settled in the ledger are skipped. Does not commit.
+    """
+    bet_ids = [bet.id for bet in bets]
+    if not bet_ids:
+        return []
+
+    rows = _append_settlements(bet_ids)
+    before = _payoffs_before(row.gambler_id for row in rows)
+    _materialize_ledger()
+    _rate_settlements(rows)
+
+    # Replay the same deltas in memory for the announcement, bet by bet in the given order
+    rows_by_bet: dict[int, list] = {bet_id: [] for bet_id in bet_ids}
+    for row in rows:
+        rows_by_bet[row.bet_id].append(row)
+    payoffs = {gambler_id: payoff for gambler_id, (_, payoff) in before.items()}
+
+    settlements: list[BetSettlement] = []
+    for bet in bets:
+        gamblers: list[GamblerSettlement] = []
+        for row in sorted(rows_by_bet[bet.id], key=lambda row: before[row.gambler_id][0].lower()):
+            old_payoff = payoffs[row.gambler_id]
+            payoffs[row.gambler_id] = old_payoff + row.payoff
+            gamblers.append(GamblerSettlement(row.gambler_id, before[row.gambler_id][0], row.bet_on, bool(row.correct), old_payoff, payoffs[row.gambler_id]))
+        settlements.append(BetSettlement(bet, gamblers))
+    return settlements
+
+def settle_bets(results: dict[int, int]) -> list[BetSettlement]:
+    """
+    Sets the results of one or many bets and credits all their participants in a single
+    transaction. `results` maps bet IDs to their outcomes (1, 0 or 2).
+    """
+    try:
+        bets: list[Bet] = []
+        for bet_id, result in results.items():
+            bet = session.get(Bet, bet_id)
+            if not bet:
+                raise KeyError(f"No bet with the given ID: {bet_id}")
+            _check_result(bet, result)
+            bet.winning_odd = result
+            bets.append(bet)
+        _log_settlements([bet.id for bet in bets])
+        session.flush()
+
+        settlements = _apply_settlements(bets)
+        session.commit()
+        for bet in bets:
+            invalidate_bet(bet.id)
+            open_bets.discard(bet.id)
+            pick_counts.discard(bet.id)
+            pick_bitsets.settle(bet.id, bet.winning_odd)
+        return settlements
+    except Exception:
+        session.rollback()
+        raise
+
+def resettle_bet(bet_id: int, result: int) -> BetSettlement | None:
+    """
+    Corrects the result of an already settled bet. Appends ledger rows reversing its
+    current settlement and rows for the corrected result, then materializes them, all in
+    one transaction. Returns None without writing anything if the result is unchanged.
+    """
+    try:
+        bet = session.get(Bet, bet_id)
+        if not bet:
+            raise KeyError(f"No bet with the given ID: {bet_id}")
+        if result not in Constant.BET_OUTCOMES:
+            raise ValueError("Invalid result. Result must be one of: 1 (home team wins), 0 (draw), or 2 (away team wins).")
+        if bet.winning_odd is None:
+            raise ValueError(f"This bet ({bet}) has not resulted yet.")
+        if bet.winning_odd == result:
+            return None
+
+        reversals = _append_reversals(bet)
+        bet.winning_odd = result
+        _log_settlements([bet.id])
+        session.flush()
+        rows = _append_settlements([bet.id])
+
+        before = _payoffs_before([row.gambler_id for row in reversals] + [row.gambler_id for row in rows])
+        _materialize_ledger()
+        # Every later pick of the participants was rated on top of the old result
+        participants = {row.gambler_id for row in reversals} | {row.gambler_id for row in rows}
+        if participants:
+            ratings.rebuild(session.connection(), list(participants))
+        session.commit()
+        invalidate_bet(bet.id)
+        pick_bitsets.settle(bet.id, result)
+
+        reversed_payoffs = {row.gambler_id: row.payoff for row in reversals}
+        gamblers = []
+        for row in sorted(rows, key=lambda row: before[row.gambler_id][0].lower()):
+            name, old_payoff = before[row.gambler_id]
+            new_payoff = old_payoff + reversed_payoffs.get(row.gambler_id, 0.0) + row.payoff
+            gamblers.append(GamblerSettlement(row.gambler_id, name, row.bet_on, bool(row.correct), old_payoff, new_payoff))
+        return BetSettlement(bet, gamblers)
+    except Exception:
+        session.rollback()
+        raise
 
-            if bet_on == bet.winning_odd:
-                correct_bets += 1
-                total_payoff += (
-                    bet.odd_1 if bet_on == 1 else bet.odd_0 if bet_on == 0 else bet.odd_2
-                )
-            else:
-                wrong_bets += 1
+def update_gamblers_on_bet_result(bet_id: int):
+    bet = get_bet(bet_id=bet_id)
+    settlement, = _apply_settlements([bet])
+    session.commit()
 
-            # Subtract participation fee
-            total_payoff -= 1
+    if not settlement.gamblers:
+        print(f"No gamblers placed a bet on: {bet}")
+        return
+    return settlement.lines()
+
+def set_all_gamblers_global_stats(incremental: bool = False):
+    """
+    Rebuilds every gambler's correct/wrong/total/payoff from the settlement ledger with one
+    grouped aggregation. With `incremental`, only the ledger rows added since the last
+    materialization are applied.
+    """
+    _materialize_ledger()
+    if incremental:
+        session.commit()
+        return
 
-        # Update gambler's stats
-        gambler.correct = correct_bets
-        gambler.wrong = wrong_bets
-        gambler.total = total_bets
-        gambler.payoff = round(total_payoff, 2)
+    totals = (
+        select(
+            SettlementLedger.gambler_id,
+            func.sum(SettlementLedger.correct).label("correct"),
+            func.sum(SettlementLedger.wrong).label("wrong"),
+            func.sum(SettlementLedger.total).label("total"),
+            func.sum(SettlementLedger.payoff).label("payoff"),
+        )
+        .group_by(SettlementLedger.gambler_id)
+        .subquery()
+    )
+    # Outer join so that gamblers without any settled picks are reset to zero
+    stats = (
+        select(
+            Gambler.id.label("gambler_id"),
+            func.coalesce(totals.c.correct, 0).label("correct"),
+            func.coalesce(totals.c.wrong, 0).label("wrong"),
+            func.coalesce(totals.c.total, 0).label("total"),
+            func.round(func.coalesce(totals.c.payoff, 0.0), 2).label("payoff"),
+        )
+        .outerjoin(totals, totals.c.gambler_id == Gambler.id)
+        .subquery()
+    )
+    updated = session.execute(
+        update(Gambler)
+        .where(Gambler.id == stats.c.gambler_id)
+        .values(
+            correct=stats.c.correct,
+            wrong=stats.c.wrong,
+            total=stats.c.total,
+            payoff=stats.c.payoff,
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    _refresh_leaderboard()
+    _invalidate_gamblers()
+    ratings.rebuild(session.connection())
 
     # Commit updates
     session.commit()
-    print("Global stats updated for all gamblers.")
+    print(f"Global stats updated for {updated} gamblers.")
 
 def get_weekly_stats(week_number: int):
     return (
@@ -419,54 +1155,119 @@ def get_weekly_stats(week_number: int):
         .all()
     )
 
-def update_weekly_stats(week_number: int):
-    all_gamblers = get_all_gamblers()
-    session.query(WeeklyStatistics).filter(WeeklyStatistics.week_num == week_number).delete()
+def get_pick_matrix() -> analytics.PickMatrix:
+    """Every gambler's pick on every bet as NumPy arrays, read straight from the DB-API cursor."""
+    return analytics.load_pick_matrix(session.connection())
 
-    for gambler in all_gamblers:
-        total, correct, wrong, payoff = 0, 0, 0, 0.0
+def get_week_state(week_number: int) -> simulation.WeekState:
+    """A week's settled payoffs with its unsettled bets and their picks, for the outlook simulation."""
+    return simulation.load_week_state(session.connection(), week_number)
 
-        stmt = (
-            select(gambler_bet_table.c.bet_id, gambler_bet_table.c.bet_on)
-            .join(Bet, Bet.id == gambler_bet_table.c.bet_id)
-            .where(gambler_bet_table.c.gambler_id == gambler.id, Bet.week == week_number)
-        )
-        gambler_bets = session.execute(stmt).fetchall()
-        
-        for bet_id, bet_on in gambler_bets:
-            bet = get_bet(bet_id)
-
-            if bet.winning_odd is None:  # Skip if the bet result is not set
-                continue
-
-            if bet_on == bet.winning_odd:
-                correct += 1
-                payoff += bet.odd_1 if bet_on == 1 else bet.odd_0 if bet_on == 0 else bet.odd_2
-            else:
-                wrong += 1
-
-            payoff -= 1  # Subtract participation fee
-            total += 1
-
-        weekly_stat = WeeklyStatistics(
-            week_num=week_number,
-            gambler_id=gambler.id,
-            name=gambler.name,
-            rank=None,
-            payoff=round(payoff, 2),
-            correct=correct,
-            wrong=wrong,
-            total=total
+def get_ratings(limit: int = 20, min_rated: int = 0) -> list:
+    """
+    The best rated gamblers by conservative rating (rating minus two deviations), so that
+    a high rating built on a handful of picks does not top the list. Reads the stored values.
+    """
+    conservative = Rating.rating - 2 * Rating.deviation
+    stmt = (
+        select(Gambler.name, Rating.rating, Rating.deviation, Rating.rated, conservative.label("conservative"))
+        .join(Gambler, Gambler.id == Rating.gambler_id)
+        .where(Rating.rated >= min_rated)
+        .order_by(conservative.desc())
+        .limit(limit)
+    )
+    return session.execute(stmt).all()
+
+def get_leaderboard(week_number: int) -> list:
+    """
+    The leaderboard of a week as a single ordered read: the weekly stats of every globally
+    eligible gambler joined with their global standing, best weekly rank first.
+    """
+    stmt = (
+        select(
+            WeeklyStatistics.rank.label("weekly_rank"),
+            WeeklyStatistics.name,
+            WeeklyStatistics.payoff.label("weekly_payoff"),
+            WeeklyStatistics.correct.label("weekly_correct"),
+            WeeklyStatistics.total.label("weekly_total"),
+            Leaderboard.rank.label("global_rank"),
+            Leaderboard.payoff.label("global_payoff"),
+            Leaderboard.correct.label("global_correct"),
+            Leaderboard.total.label("global_total"),
         )
-        session.add(weekly_stat)
+        .join(Leaderboard, Leaderboard.gambler_id == WeeklyStatistics.gambler_id)
+        .where(WeeklyStatistics.week_num == week_number, Leaderboard.rank.is_not(None))
+        .order_by(WeeklyStatistics.rank, WeeklyStatistics.name)
+    )
+    return session.execute(stmt).all()
+
+def get_app_state(name: str) -> str | None:
+    state = session.get(AppState, name)
+    return state.value if state else None
+
+def set_app_state(name: str, value: str):
+    session.merge(AppState(name=name, value=value))
     session.commit()
 
-    weekly_stats = (
-        session.query(WeeklyStatistics)
-        .filter(WeeklyStatistics.week_num == week_number)
-        .order_by(WeeklyStatistics.payoff.desc())
-        .all()
+def get_leaderboard_message(guild_id: int, week: int) -> LeaderboardMessage | None:
+    return session.get(LeaderboardMessage, (guild_id, week))
+
+def set_leaderboard_message(guild_id: int, week: int, channel_id: int, message_id: int, content_hash: str):
+    session.merge(LeaderboardMessage(
+        guild_id=guild_id,
+        week=week,
+        channel_id=channel_id,
+        message_id=message_id,
+        content_hash=content_hash,
+    ))
+    session.commit()
+
+def update_weekly_stats(week_number: int, last_week: int | None = None):
+    """
+    Recomputes and ranks the weekly statistics of every gambler for `week_number`, or for
+    every week from `week_number` to `last_week` inclusive, from the settlement ledger.
+    Aggregation, RANK() and the upsert into weekly_statistics all run as a single
+    INSERT ... SELECT statement.
+    """
+    last_week = week_number if last_week is None else last_week
+    _materialize_ledger()
+
+    weeks = select(literal(week_number).label("week")).cte("weeks", recursive=True)
+    weeks = weeks.union_all(select(weeks.c.week + 1).where(weeks.c.week < last_week))
+
+    totals = _net_ledger(SettlementLedger.week.between(week_number, last_week)).subquery()
+    payoff = func.round(func.coalesce(totals.c.payoff, 0.0), 2)
+    correct = func.coalesce(totals.c.correct, 0)
+    wrong = func.coalesce(totals.c.wrong, 0)
+    total = func.coalesce(totals.c.total, 0)
+
+    # Every gambler gets a row for every week, even without any resulted picks in it
+    ranked = (
+        select(
+            weeks.c.week,
+            Gambler.id,
+            Gambler.name,
+            func.rank().over(partition_by=weeks.c.week, order_by=payoff.desc()),
+            payoff,
+            correct,
+            wrong,
+            total,
+        )
+        .select_from(Gambler)
+        .join(weeks, true())
+        .outerjoin(totals, (totals.c.gambler_id == Gambler.id) & (totals.c.week == weeks.c.week))
+        .where(true())  # SQLite needs a WHERE before ON CONFLICT in an INSERT ... SELECT
+    )
+    stmt = sqlite_insert(WeeklyStatistics).from_select(
+        ["week_num", "gambler_id", "name", "rank", "payoff", "correct", "wrong", "total"],
+        ranked,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[WeeklyStatistics.week_num, WeeklyStatistics.gambler_id],
+        set_={
+            column: stmt.excluded[column]
+            for column in ("name", "rank", "payoff", "correct", "wrong", "total")
+        },
     )
-    for rank, stat in enumerate(weekly_stats, start=1):
-        stat.rank = rank
+    session.execute(stmt)
     session.commit()
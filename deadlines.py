@@ -0,0 +1,69 @@
+import asyncio
+import heapq
+from datetime import datetime
+from typing import Awaitable, Callable, Iterable
+
+from open_bets import _utc_naive, _utc_now
+
+class DeadlineScheduler:
+    """
+    One asyncio task that sleeps until the earliest scheduled bet deadline and then awaits
+    `on_deadline(bet_id)`. Deadlines are kept in a heap; rescheduling or cancelling a bet
+    only updates `_deadlines`, and stale heap entries are skipped when they come up.
+    Scheduling a deadline earlier than the current head wakes the task up.
+    """
+    def __init__(self, on_deadline: Callable[[int], Awaitable]):
+        self.on_deadline = on_deadline
+        self.fired = 0
+        self._heap: list[tuple[datetime, int]] = []
+        self._deadlines: dict[int, datetime] = {}
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    def load(self, bets: Iterable):
+        for bet in bets:
+            self.schedule(bet.id, bet.deadline)
+
+    def schedule(self, bet_id: int, deadline: datetime):
+        deadline = _utc_naive(deadline)
+        self._deadlines[bet_id] = deadline
+        heapq.heappush(self._heap, (deadline, bet_id))
+        self._start()
+        if self._heap[0] == (deadline, bet_id):
+            self._wakeup.set()
+
+    def cancel(self, bet_id: int):
+        self._deadlines.pop(bet_id, None)
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def _start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            delay = (self._heap[0][0] - _utc_now()).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, bet_id = heapq.heappop(self._heap)
+            del self._deadlines[bet_id]
+            self.fired += 1
+            try:
+                await self.on_deadline(bet_id)
+            except Exception as e:
+                print(f"Closing bet {bet_id} at its deadline failed: {e}")
@@ -4,12 +4,25 @@ from discord import app_commands
 from discord.app_commands import Choice
 from discord.ext import commands
 import discord
+import asyncio
+import functools
+import hashlib
+import json
 import os
+import time
 from dotenv import load_dotenv
-from settings import Fields, ID, Emoji, Constant
-import database
-from database import Gambler, Bet
-from embed_messages import EmbedMessages, BetButtons
+from settings import Fields, ID, Emoji
+import async_database
+import analytics
+import numpy as np
+import outbound
+import simulation
+from users import user_resolver
+from deadlines import DeadlineScheduler
+from bet_batch import parse_bet_rows, parse_result_pairs
+from database import Gambler, Bet, BetSettlement, open_bets, pick_bitsets, cache_stats
+from open_bets import OpenBet
+from embed_messages import EmbedMessages, BetButton, BetButtons, pick_count_updater
 from typing import List
 
 # Initialize the bot
@@ -17,35 +30,87 @@ load_dotenv()
 token = os.getenv("DC_BOT_TOKEN")
 intents = Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix="!", intents=intents)
+
+class Bot(commands.Bot):
+    async def close(self):
+        await super().close()
+        # The simulation workers and the DB thread would otherwise outlive the bot
+        simulation.shutdown()
+        async_database.shutdown()
+
+bot = Bot(command_prefix="!", intents=intents)
 
 
 @bot.event
 async def on_ready():
     try:
-        await bot.tree.sync()
-
-        # Register persistent views
-        all_bets = database.get_all_bets()  # Fetch all saved messages
-        for bet in all_bets:
-            if bet.message_id:
-                await reload_bet_message(bet)
-
+        timings = {}
+        started = time.perf_counter()
+
+        # Syncing is rate limited and slow, so only do it when the commands have changed
+        # (or always with SYNC_COMMANDS=always)
+        tree_hash = command_tree_hash()
+        if os.getenv("SYNC_COMMANDS") == "always" or tree_hash != await async_database.get_app_state("command_tree_hash"):
+            await bot.tree.sync()
+            await async_database.set_app_state("command_tree_hash", tree_hash)
+            timings["command sync"] = time.perf_counter() - started
+        else:
+            timings["command check (unchanged)"] = time.perf_counter() - started
+
+        # One stateless handler serves the buttons of every bet announcement
+        phase_started = time.perf_counter()
+        bot.add_dynamic_items(BetButton)
+        timings["button handlers"] = time.perf_counter() - phase_started
+
+        phase_started = time.perf_counter()
+        open_count = await async_database.load_open_bets()
+        deadline_scheduler.load(open_bets.all())
+        timings[f"open bets and deadlines ({open_count})"] = time.perf_counter() - phase_started
+
+        # Announcements whose deadline passed while the bot was down still have live buttons
+        phase_started = time.perf_counter()
+        missed = await async_database.get_missed_deadlines()
+        for bet in missed:
+            await close_betting(bet.id)
+        timings[f"missed deadlines ({len(missed)})"] = time.perf_counter() - phase_started
+
+        phase_started = time.perf_counter()
+        pick_count = await async_database.load_pick_bitsets()
+        timings[f"head-to-head bitsets ({pick_count} picks)"] = time.perf_counter() - phase_started
+
+        timings["total"] = time.perf_counter() - started
+        await report_startup(timings)
         print(f"Bot is ready. Logged in as {bot.user}")
     except Exception as e:
         print(f"Error syncing commands: {e}")
 
-async def reload_bet_message(bet: Bet):
-    channel = bot.get_channel(ID.Channels.MAC_BILDIRIM)
-    if bet.message_id and not bet.winning_odd:
-        message = await channel.fetch_message(bet.message_id)
-        # Add a persistent view for this message
-        view = BetButtons(bet)
-        bot.add_view(view, message_id=bet.message_id)
-    """ elif bet.message_id and bet.winning_odd:
-        message = await channel.fetch_message(bet.message_id)
-        match_over = EmbedMessages.bet_deadline_passed(bet)
-        await message.edit(embed=match_over) """
+async def close_betting(bet_id: int):
+    """
+    Fired by the deadline scheduler at kick-off, and at startup for deadlines missed while
+    the bot was down: closes the bet and queues disabling its buttons.
+    """
+    open_bets.discard(bet_id)
+    bet: Bet = await async_database.get_bet(bet_id=bet_id)
+    if bet.winning_odd is None and bet.message_id:
+        channel = bot.get_channel(ID.Channels.MAC_BILDIRIM)
+        if not channel:
+            return  # Not recorded as closed, so the next startup closes it
+        message = channel.get_partial_message(bet.message_id)
+        outbound.edit_message(message, embed=EmbedMessages.bet_deadline_passed(bet), view=BetButtons(bet, disabled=True))
+    await async_database.mark_betting_closed(bet_id=bet.id)
+
+deadline_scheduler = DeadlineScheduler(on_deadline=close_betting)
+
+def command_tree_hash() -> str:
+    payload = [command.to_dict(bot.tree) for command in bot.tree.get_commands()]
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+async def report_startup(timings: dict[str, float]):
+    report = "\n".join(f"- {phase}: {seconds * 1000:.0f} ms" for phase, seconds in timings.items())
+    print(f"Startup timings:\n{report}")
+    debug_channel = bot.get_channel(ID.Channels.DEBUG)
+    if debug_channel:
+        await debug_channel.send(f"🟢 **{bot.user} started**\n{report}")
 
 # ------------------------------- PLACE BET -------------------------------#
 @bot.tree.command(name="bet", description="Place your guess on a bet from the given list.")
@@ -81,7 +146,7 @@ async def place_bet_bet_on_autocomplete(
     if bet_id is None:
         return []
     try:
-        bet: Bet = database.get_bet(bet_id=bet_id)
+        bet: OpenBet | Bet = open_bets.get(bet_id) or await async_database.get_bet(bet_id=bet_id)
         options = [
             app_commands.Choice(name=f"{bet.home_team} ({bet.odd_1})", value=1),
             app_commands.Choice(name=f"Draw ({bet.odd_0})", value=0),
@@ -98,19 +163,18 @@ async def place_bet_bet_id_autocomplete(
     interaction: Interaction, current: str
 ) -> List[app_commands.Choice]:
     try:
-        available_bets: List[Bet] = database.get_all_bets()
-        filtered_bets = [
+        # Up to 25 results (Discord limit), straight from memory once the open bets are loaded
+        if open_bets.loaded:
+            available_bets: List[OpenBet] = open_bets.search(current, limit=25)
+        else:
+            available_bets: List[Bet] = await async_database.search_bets(current, status="open", limit=25)
+        return [
             app_commands.Choice(
                 name=f"({bet.field})   --->   {bet.home_team} - {bet.away_team}",
                 value=bet.id,
             )
             for bet in available_bets
-            if current.lower() in f"{bet.home_team} {bet.away_team}".lower()
-            and bet.winning_odd not in Constant.BET_OUTCOMES
-            and bet.deadline > datetime.now()
         ]
-        # Return up to 25 results (Discord limit)
-        return filtered_bets[:25]
     except Exception as e:
         print(f"Error in autocomplete: {e}")
         return []
@@ -138,7 +202,7 @@ async def place_bet_admin(interaction: Interaction, bet_as: str, bet_id: int, be
 
 @place_bet_admin.autocomplete("bet_as")
 async def place_bet_bet_as_autocomplete(interaction: Interaction, current: str):
-    gamblers: List[Gambler] = database.get_all_gamblers()
+    gamblers: List[Gambler] = await async_database.get_all_gamblers()
     gamblers.sort(key=lambda gambler: gambler.name.lower())
     return [
         Choice(name=gambler.name, value=str(gambler.id))
@@ -152,19 +216,19 @@ async def place_bet_as_bet_id_autocomplete(
 ) -> List[app_commands.Choice]:
     isAdmin = ID.Roles.ADMIN in [role.id for role in interaction.user.roles]
     try:
-        available_bets: List[Bet] = database.get_all_bets()
-        filtered_bets = [
+        # Up to 25 results (Discord limit), admins can also pick matches that have started
+        if open_bets.loaded and not isAdmin:
+            available_bets: List[OpenBet] = open_bets.search(current, limit=25)
+        else:
+            status = "unsettled" if isAdmin else "open"
+            available_bets: List[Bet] = await async_database.search_bets(current, status=status, limit=25)
+        return [
             app_commands.Choice(
                 name=f"({bet.field})   --->   {bet.home_team} - {bet.away_team}",
                 value=bet.id,
             )
             for bet in available_bets
-            if current.lower() in f"{bet.home_team} {bet.away_team}".lower()
-            and bet.winning_odd not in Constant.BET_OUTCOMES
-            and (bet.deadline > datetime.now() or isAdmin)
         ]
-        # Return up to 25 results (Discord limit)
-        return filtered_bets[:25]
     except Exception as e:
         print(f"Error in autocomplete: {e}")
         return []
@@ -237,7 +301,7 @@ async def create_bet(
         bet = {column: val for column, val in zip(cols, values)}
 
         # Create the bet in the database
-        created_bet = database.add_bet(bet)
+        created_bet = await async_database.add_bet(bet)
 
         # Send confirmation message to the admin channel
         await interaction.response.send_message(embed=EmbedMessages.bet_created_confirmation(created_bet), ephemeral=True)
@@ -245,8 +309,7 @@ async def create_bet(
         # Send the fancy announcement message to the mac-bildirim channel
         mac_bildirim_kanal = interaction.guild.get_channel(ID.Channels.MAC_BILDIRIM)
         if mac_bildirim_kanal:
-            bet_message:Message = await mac_bildirim_kanal.send(embed=EmbedMessages.bet_created_announcement(created_bet), view=BetButtons(created_bet))
-            database.set_bet_message_id(created_bet.id, bet_message.id)
+            await announce_bet(mac_bildirim_kanal, created_bet)
         else:
             await interaction.followup.send("Announcement channel not found. Please check the bot's configuration.", ephemeral=True)
 
@@ -263,6 +326,46 @@ async def create_bet_field_autocomplete(interaction: Interaction, current: str):
     ]
 
 
+# ------------------------------- CREATE BETS FROM A FILE -------------------------------#
+@bot.tree.command(name="create_batch", description="Create many bets at once from a CSV or JSON file.")
+@app_commands.describe(
+    file="A .csv (with a header row) or .json file of bets, with the same fields as /create.",
+)
+async def create_batch(interaction: Interaction, file: discord.Attachment):
+    required_role_id = ID.Roles.ADMIN
+    if not await isAuthorisedUser(interaction=interaction, allowed_roles_id_list=required_role_id):
+        return
+
+    required_channel_id = ID.Channels.ADMIN
+    if not await isAuthorisedChannel(interaction=interaction, allowed_channels_id_list=required_channel_id):
+        return
+
+    await interaction.response.defer(ephemeral=True)
+    try:
+        # Validate every row before writing anything; invalid rows do not stop the valid ones
+        rows, errors = parse_bet_rows(file.filename, await file.read())
+        created_bets: List[Bet] = await async_database.add_bets([description for _, description in rows]) if rows else []
+
+        # Announcements go out through the outbound queue, paced by the channel's rate budget
+        mac_bildirim_kanal = interaction.guild.get_channel(ID.Channels.MAC_BILDIRIM)
+        if mac_bildirim_kanal:
+            for bet in created_bets:
+                outbound.dispatcher.enqueue(f"channel:{mac_bildirim_kanal.id}", functools.partial(announce_bet, mac_bildirim_kanal, bet))
+        elif created_bets:
+            errors.append("Announcement channel not found. Please check the bot's configuration.")
+
+        report = f"{Emoji.CHECK} Created {len(created_bets)} bets, their announcements are on the way.\n"
+        for (number, _), bet in zip(rows, created_bets):
+            report += f"- Row {number}: `{bet.id}` {bet.home_team} vs {bet.away_team}\n"
+        if errors:
+            report += f"\n{Emoji.X} {len(errors)} rows were skipped:\n" + "\n".join(f"- {error}" for error in errors)
+    except Exception as e:
+        report = f"❌ The batch could not be created: {e}"
+
+    for i in range(0, len(report), 2000):
+        await interaction.followup.send(report[i : i + 2000], ephemeral=True)
+
+
 # ------------------------------- SET RESULT -------------------------------#
 @bot.tree.command(name="result", description="Set the result of a bet.")
 @app_commands.describe(
@@ -283,36 +386,17 @@ async def set_bet_result(interaction: Interaction, bet_id: int, result: int):
         return
 
     try:
-        # Update the bet result
-        bet: Bet = database.set_bet_result(bet_id=bet_id, result=result)
-        results = database.update_gamblers_on_bet_result(bet_id=bet_id)
-
-        # Prepare the match result announcement
-        result_text = (
-            f"🎉 **Match Result Announcement!** 🎉\n\n"
-            f"🏟️ **Field:** {bet.field}\n"
-            f"⚽ **Match:** `{bet.home_team}` vs `{bet.away_team}`\n"
-        )
-        result_text += (
-            f"🏆 **Final Result:** `{bet.home_team}` Wins 🏠\n"
-            if result == 1
-            else "🏆 **Final Result:** `Draw` 🤝\n"
-            if result == 0
-            else f"🏆 **Final Result:** `{bet.away_team}` Wins 🚩\n"
-        )
-
-        # Add gamblers' outcomes
-        result_text += "\n📊 **Gamblers Performance:**\n"
-        for gambler_result in results:
-            result_text += f"- {gambler_result}\n"
+        # Set the bet result and settle its gamblers in one transaction
+        settlement, = await async_database.settle_bets({bet_id: result})
+        bet: Bet = settlement.bet
+        result_text = result_announcement(settlement)
 
         # Send the match result notification to the general channel
         mac_sonuc_channel = interaction.guild.get_channel(ID.Channels.MAC_SONUC)
         if not mac_sonuc_channel:
             raise ValueError("General channel not found.")
         
-        await send_split_message(mac_sonuc_channel, result_text)
-        database.update_weekly_stats(week_number=bet.week)
+        send_split_message(mac_sonuc_channel, result_text)
         await update_leaderboard(interaction=interaction, week=bet.week)
         await interaction.response.send_message(
             f"{bet} has resulted successfully. Gambler statistics and the leaderboard has been updated.",
@@ -321,6 +405,50 @@ async def set_bet_result(interaction: Interaction, bet_id: int, result: int):
     except Exception as e:
         await interaction.response.send_message(str(e), ephemeral=True)
 
+# ------------------------------- SET THE RESULTS OF A MATCHDAY -------------------------------#
+@bot.tree.command(name="results_batch", description="Set the results of many bets at once.")
+@app_commands.describe(
+    results="Bet ID and result pairs, e.g. `12345678:1 23456789:0` (1 for Home, 0 for Draw, 2 for Away)",
+)
+async def set_bet_results_batch(interaction: Interaction, results: str):
+    required_role_id = ID.Roles.ADMIN
+    if not await isAuthorisedUser(
+        interaction=interaction, allowed_roles_id_list=required_role_id
+    ):
+        return
+
+    required_channel_id = ID.Channels.ADMIN
+    if not await isAuthorisedChannel(
+        interaction=interaction, allowed_channels_id_list=required_channel_id
+    ):
+        return
+
+    await interaction.response.defer(ephemeral=True)
+    try:
+        mac_sonuc_channel = interaction.guild.get_channel(ID.Channels.MAC_SONUC)
+        if not mac_sonuc_channel:
+            raise ValueError("General channel not found.")
+
+        # All bets are settled, and their weeks re-ranked, in one transaction; nothing is
+        # written if any of them cannot be settled
+        settlements: List[BetSettlement] = await async_database.settle_bets(parse_result_pairs(results))
+
+        # One combined summary, split into pages between lines
+        send_split_message(mac_sonuc_channel, "\n".join(result_announcement(settlement) for settlement in settlements))
+
+        # One leaderboard edit per affected week, usually just one
+        weeks = sorted({settlement.bet.week for settlement in settlements})
+        for week in weeks:
+            await update_leaderboard(interaction=interaction, week=week)
+
+        await interaction.followup.send(
+            f"{len(settlements)} bets have resulted successfully. Gambler statistics and the leaderboard "
+            f"of Week {', '.join(f'#{week}' for week in weeks)} have been updated.",
+            ephemeral=True,
+        )
+    except Exception as e:
+        await interaction.followup.send(str(e), ephemeral=True)
+
 @set_bet_result.autocomplete("result")
 async def set_bet_result_autocomplete(
     interaction: Interaction, current: str
@@ -329,7 +457,7 @@ async def set_bet_result_autocomplete(
     if bet_id is None:
         return []
     try:
-        bet = database.get_bet(bet_id=bet_id)
+        bet = await async_database.get_bet(bet_id=bet_id)
         options = [
             app_commands.Choice(name=f"{bet.home_team} ({bet.odd_1})", value=1),
             app_commands.Choice(name=f"Draw ({bet.odd_0})", value=0),
@@ -345,18 +473,74 @@ async def set_bet_bet_id_autocomplete(
     interaction: Interaction, current: str
 ) -> List[app_commands.Choice]:
     try:
-        available_bets: List[Bet] = database.get_all_bets()
-        filtered_bets = [
+        # Up to 25 results (Discord limit)
+        available_bets: List[Bet] = await async_database.search_bets(current, status="unsettled", limit=25)
+        return [
             app_commands.Choice(
                 name=f"({bet.field})   --->   {bet.home_team} - {bet.away_team}",
                 value=bet.id,
             )
             for bet in available_bets
-            if current.lower() in f"{bet.home_team} {bet.away_team}".lower()
-            and bet.winning_odd not in Constant.BET_OUTCOMES
         ]
-        # Return up to 25 results (Discord limit)
-        return filtered_bets[:25]
+    except Exception as e:
+        print(f"Error in autocomplete: {e}")
+        return []
+
+# ------------------------------- CORRECT A RESULT -------------------------------#
+@bot.tree.command(name="correct_result", description="Correct the result of an already resulted bet.")
+@app_commands.default_permissions(administrator=True)  # Restricts visibility to admins
+@app_commands.describe(
+    bet_id="Select the bet whose result was set wrong.",
+    result="Corrected result: 1 for Home, 0 for Draw, 2 for Away",
+)
+async def correct_bet_result(interaction: Interaction, bet_id: int, result: int):
+    required_channel_id = ID.Channels.ADMIN
+    if not await isAuthorisedChannel(
+        interaction=interaction, allowed_channels_id_list=required_channel_id
+    ):
+        return
+
+    try:
+        # Reverses the old settlement and applies the corrected one in one transaction
+        settlement = await async_database.resettle_bet(bet_id=bet_id, result=result)
+        if settlement is None:
+            await interaction.response.send_message("The bet already has this result, nothing has changed.", ephemeral=True)
+            return
+
+        bet: Bet = settlement.bet
+        result_text = (
+            f"✏️ **Corrected Match Result** ✏️\n\n"
+            f"⚽ **Match:** `{bet.home_team}` vs `{bet.away_team}`\n"
+            f"🏆 **Final Result:** `{ {1: bet.home_team, 0: 'Draw', 2: bet.away_team}[result] }`\n"
+            "\n📊 **Gamblers Performance:**\n"
+        )
+        for gambler_result in settlement.lines():
+            result_text += f"- {gambler_result}\n"
+
+        mac_sonuc_channel = interaction.guild.get_channel(ID.Channels.MAC_SONUC)
+        if not mac_sonuc_channel:
+            raise ValueError("General channel not found.")
+
+        send_split_message(mac_sonuc_channel, result_text)
+        await update_leaderboard(interaction=interaction, week=bet.week)
+        await interaction.response.send_message(f"The result of {bet} has been corrected.", ephemeral=True)
+    except Exception as e:
+        await interaction.response.send_message(str(e), ephemeral=True)
+
+@correct_bet_result.autocomplete("bet_id")
+async def correct_bet_result_bet_id_autocomplete(
+    interaction: Interaction, current: str
+) -> List[app_commands.Choice]:
+    try:
+        bets: List[Bet] = await async_database.search_bets(current, status="all", limit=25)
+        return [
+            app_commands.Choice(
+                name=f"({bet.field})   --->   {bet.home_team} - {bet.away_team}",
+                value=bet.id,
+            )
+            for bet in bets
+            if bet.winning_odd is not None
+        ]
     except Exception as e:
         print(f"Error in autocomplete: {e}")
         return []
@@ -368,25 +552,22 @@ async def set_bet_bet_id_autocomplete(
     bet_id="Enter the ID of the match to bet on.",
 )
 async def bet_stats(interaction: Interaction, bet_id: int):
-    bet = database.get_bet(bet_id=bet_id)
-    msg = [gambler.name for gambler in bet.gamblers]
+    msg = await async_database.get_bet_gambler_names(bet_id=bet_id)
     await interaction.response.send_message("\n".join(msg))
 @bet_stats.autocomplete("bet_id")
 async def bet_stats_bet_id_autocomplete(
     interaction: Interaction, current: str
 ) -> List[app_commands.Choice]:
     try:
-        available_bets: List[Bet] = database.get_all_bets()
-        filtered_bets = [
+        # Up to 25 results (Discord limit)
+        available_bets: List[Bet] = await async_database.search_bets(current, status="all", limit=25)
+        return [
             app_commands.Choice(
                 name=f"({bet.field})   --->   {bet.home_team} - {bet.away_team}",
                 value=bet.id,
             )
             for bet in available_bets
-            if current.lower() in f"{bet.home_team} {bet.away_team}".lower()
         ]
-        # Return up to 25 results (Discord limit)
-        return filtered_bets[:25]
     except Exception as e:
         print(f"Error in autocomplete: {e}")
         return []
@@ -405,8 +586,8 @@ async def get_me(interaction: Interaction):
 
     try:
         # Fetch gambler from the database
-        gambler = database.get_gambler(gambler_dc_id=interaction.user.id)
-        bets = database.get_gambler_bet_details(gambler_dc_id=interaction.user.id)
+        gambler = await async_database.get_gambler(gambler_dc_id=interaction.user.id)
+        bets = await async_database.get_gambler_bet_details(gambler_dc_id=interaction.user.id)
 
         if not bets:
             await interaction.response.send_message(
@@ -457,6 +638,92 @@ async def get_me(interaction: Interaction):
             ephemeral=True
         )
 
+# ------------------------------- RATINGS -------------------------------#
+@bot.tree.command(name="ratings", description="Show the skill ratings: picks weighed against the odds.")
+@app_commands.describe(top="How many gamblers to list.")
+async def show_ratings(interaction: Interaction, top: app_commands.Range[int, 1, 25] = 10):
+    required_roles_id_list = [ID.Roles.ADMIN, ID.Roles.GAMBLER]
+    if not await isAuthorisedUser(interaction=interaction, allowed_roles_id_list=required_roles_id_list):
+        return
+    required_channel_id_list = [ID.Channels.MAC_BILDIRIM, ID.Channels.ADMIN]
+    if not await isAuthorisedChannel(interaction=interaction, allowed_channels_id_list=required_channel_id_list):
+        return
+
+    rows = await async_database.get_ratings(limit=top)
+    if not rows:
+        await interaction.response.send_message("No bets have been settled yet, so nobody is rated.", ephemeral=True)
+        return
+
+    table = f"{'Rank':<6}{'Gambler':<15}{'Rating':>8}{'±':>6}{'Picks':>7}\n"
+    for rank, row in enumerate(rows, start=1):
+        table += f"{rank:<6}{row.name[:14]:<15}{row.rating:>8.0f}{row.deviation:>6.0f}{row.rated:>7}\n"
+    embed = Embed(
+        title="📈 Skill Ratings",
+        description=(
+            f"```\n{table}```"
+            "Every settled pick is scored against the odds: a correct long shot counts for more than a correct favourite. "
+            "Ranked by rating minus twice its uncertainty, so a few lucky picks are not enough."
+        ),
+        colour=Colour.gold(),
+    )
+    await interaction.response.send_message(embed=embed)
+
+
+# ------------------------------- HEAD TO HEAD -------------------------------#
+@bot.tree.command(name="h2h", description="Compare your picks with another gambler's.")
+@app_commands.describe(opponent="Select the gambler to compare your picks with.")
+async def head_to_head(interaction: Interaction, opponent: str):
+    if not await isRegisteredUser(interaction=interaction):
+        return
+    required_role_id = ID.Roles.GAMBLER
+    if not await isAuthorisedUser(interaction=interaction, allowed_roles_id_list=required_role_id):
+        return
+    required_channel_id = ID.Channels.MAC_BILDIRIM
+    if not await isAuthorisedChannel(interaction=interaction, allowed_channels_id_list=required_channel_id):
+        return
+
+    try:
+        rival: Gambler = await async_database.get_gambler(gambler_dc_id=int(opponent))
+        h2h = pick_bitsets.head_to_head(interaction.user.id, rival.id)
+        if h2h.common == 0:
+            await interaction.response.send_message(f"You and {rival.name} have not picked any of the same bets yet.", ephemeral=True)
+            return
+
+        verdict = (
+            "🏆 You came out ahead on the bets you disagreed on." if h2h.won > h2h.lost else
+            f"😬 {rival.name} came out ahead on the bets you disagreed on." if h2h.lost > h2h.won else
+            "🤝 Neither of you came out ahead on the bets you disagreed on."
+        )
+        embed = Embed(
+            title=f"⚔️ You vs {rival.name}",
+            description=(
+                f"**Bets you both picked:** {h2h.common}\n"
+                f"**Same pick:** {h2h.same} ({h2h.agreement:.1%})\n"
+                f"**Resulted bets you disagreed on:** {h2h.decided}\n"
+                f"**You were right:** {h2h.won} · **{rival.name} was right:** {h2h.lost}\n\n"
+                f"{verdict}"
+            ),
+            colour=Colour.blue(),
+        )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+    except (KeyError, ValueError):
+        # Unknown ID, or free text typed instead of picking an autocomplete entry
+        await interaction.response.send_message(f"No gambler with the given ID: {opponent}", ephemeral=True)
+
+@head_to_head.autocomplete("opponent")
+async def head_to_head_opponent_autocomplete(interaction: Interaction, current: str) -> List[app_commands.Choice]:
+    try:
+        gamblers: List[Gambler] = await async_database.get_all_gamblers()
+        return [
+            app_commands.Choice(name=gambler.name, value=str(gambler.id))
+            for gambler in gamblers
+            if gambler.id != interaction.user.id and current.lower() in gambler.name.lower()
+        ][:25]
+    except Exception as e:
+        print(f"Error in autocomplete: {e}")
+        return []
+
+
 # ------------------------------- GET ANY GAMBLER'S BETS -------------------------------#
 @bot.tree.command(name="gambler", description="Get any gambler's statistics.")
 @app_commands.default_permissions(administrator=True)  # Restricts visibility to admins
@@ -467,8 +734,8 @@ async def get_gambler(interaction: Interaction, gambler_id: str):
     gambler_id = int(gambler_id)
     
     try:
-        gambler: Gambler = database.get_gambler(gambler_dc_id=gambler_id)
-        bets = database.get_gambler_bet_details(gambler_dc_id=gambler_id)
+        gambler: Gambler = await async_database.get_gambler(gambler_dc_id=gambler_id)
+        bets = await async_database.get_gambler_bet_details(gambler_dc_id=gambler_id)
 
         if not bets:
             await interaction.response.send_message(
@@ -488,7 +755,7 @@ async def get_gambler_gambler_autocomplete(
     interaction: Interaction, current: str
     ) -> List[app_commands.Choice]:
     try:
-        all_gamblers: List[Gambler] = database.get_all_gamblers()
+        all_gamblers: List[Gambler] = await async_database.get_all_gamblers()
         filtered_gamblers = [
             app_commands.Choice(name=f"{gambler.name}", value=str(gambler.id))
             for gambler in all_gamblers
@@ -521,14 +788,14 @@ async def register(interaction: Interaction, discord_id: str = None, name: str =
         return
 
     try:
-        # Fetch the user using the provided Discord ID
-        user = await bot.fetch_user(discord_id)
+        # Resolve the user from the caches, fetching it only if it is not cached
+        user = await user_resolver.resolve(bot, int(discord_id), interaction)
         if user is None:
             raise ValueError("Invalid Discord ID. User not found.")
 
         # Set the name to the global username of the user
         name = user.global_name if name == "" else name
-        gambler: Gambler = database.add_gambler(discord_id=discord_id, name=name)
+        gambler: Gambler = await async_database.add_gambler(discord_id=discord_id, name=name)
         await interaction.response.send_message(
             f"`{gambler.name} has been registered successfully.`"
         )
@@ -591,14 +858,14 @@ async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
 
     # Register the user in the database
     try:
-        database.add_gambler(
+        await async_database.add_gambler(
             discord_id=payload.user_id, name=member.global_name
         )  # Add user to database
-        await member.send(f"`You have been registered successfully as {member.name}.`")
+        outbound.send_dm(bot, payload.user_id, f"`You have been registered successfully as {member.name}.`")
     except ValueError as e:
-        await member.send(str(e))
+        outbound.send_dm(bot, payload.user_id, str(e))
     except Exception as e:
-        await member.send(str(e) + "Please contact the admins with this error message.")
+        outbound.send_dm(bot, payload.user_id, str(e) + "Please contact the admins with this error message.")
 
 
 # ------------------------------- UPDATE THE LEADERBOARD -------------------------------#
@@ -615,12 +882,17 @@ async def update_leaderboard_command(interaction: Interaction, week: int):
 # ------------------------------- UPDATE THE WEEKLY STATS -------------------------------#
 @bot.tree.command(name="update_weekly_stats", description="Update the statistics of gamblers for the given week. This command is to use in case of ambiguities.")
 @app_commands.default_permissions(administrator=True)  # Restricts visibility to admins
-async def update_weekly_stats(interaction: Interaction, week: int):
+@app_commands.describe(
+    week="The week to update, or the first week of the range.",
+    last_week="Optionally, the last week of the range to update in one go.",
+)
+async def update_weekly_stats(interaction: Interaction, week: int, last_week: int = None):
+    weeks = f"Week#{week}" if last_week is None else f"Weeks #{week}-#{last_week}"
     try:
-        database.update_weekly_stats(week_number=week)
-        await interaction.response.send_message(f"Weekly stats has been updated for Week#{week}.")
+        await async_database.update_weekly_stats(week_number=week, last_week=last_week)
+        await interaction.response.send_message(f"Weekly stats has been updated for {weeks}.")
     except Exception as e:
-        await interaction.response.send_message(f"Weekly stats has failed for Week#{week}. {e}")
+        await interaction.response.send_message(f"Weekly stats has failed for {weeks}. {e}")
 
 
 # ------------------------------- START A NEW WEEK -------------------------------#
@@ -628,22 +900,156 @@ async def update_weekly_stats(interaction: Interaction, week: int):
 @app_commands.default_permissions(administrator=True)  # Restricts visibility to admins
 async def new_week(interaction: Interaction, week: int):
     try:
-        database.update_weekly_stats(week_number=week)
+        await async_database.update_weekly_stats(week_number=week)
         await update_leaderboard(interaction=interaction, week=week)
         await interaction.response.send_message(f"A new week has just started as Week#{week}.")
     except Exception as e:
         await interaction.response.send_message(f"New week cannot be started for Week#{week}: {e}")
 
 
+# ------------------------------- SHOW BOT METRICS -------------------------------#
+@bot.tree.command(name="metrics", description="Show the bot's cache and queue metrics.")
+@app_commands.default_permissions(administrator=True)  # Restricts visibility to admins
+async def metrics(interaction: Interaction):
+    lines = ["**Caches**"]
+    for name, stats in cache_stats().items():
+        lines.append(
+            f"- `{name}`: {stats['hits']} hits / {stats['misses']} misses "
+            f"({stats['hit_rate']:.0%}), {stats['size']} cached, {stats['evictions']} evicted"
+        )
+    lines.append(f"- `open bets`: {len(open_bets)} indexed, {len(deadline_scheduler)} deadlines scheduled, {deadline_scheduler.fired} closed")
+    stats = user_resolver.stats()
+    lines.append(
+        f"- `users`: {stats['interaction']} from interactions, {stats['gateway']} from the gateway, "
+        f"{stats['cache']} cached, {stats['rest']} fetched ({stats['rest_avoided']} REST calls avoided)"
+    )
+    if async_database.pick_batcher:
+        stats = async_database.pick_batcher.stats()
+        lines.append(f"**Pick batching**\n- {stats['picks']} picks in {stats['batches']} commits ({stats['avg_batch']:.1f} per commit)")
+    debouncer = pick_count_updater.debouncer
+    lines.append(f"- `pick counts`: {debouncer.runs} announcement edits, {debouncer.folded} folded into them")
+    stats = outbound.dispatcher.stats()
+    lines.append(
+        f"**Outbound queue**\n- {stats['queued']} queued on {stats['routes']} routes, "
+        f"{stats['sent']} sent, {stats['failed']} failed, {stats['retries']} retries, "
+        f"{stats['coalesced']} coalesced, {stats['dropped']} dropped\n"
+        f"- send latency p50 {stats['p50_ms']:.0f} ms, p95 {stats['p95_ms']:.0f} ms"
+    )
+    await interaction.response.send_message("\n".join(lines), ephemeral=True)
+
+@bot.tree.command(name="analytics", description="Show hit rates and ROI over the whole betting history.")
+@app_commands.describe(top="How many gamblers to list by ROI.", min_picks="Leave out gamblers with fewer settled picks.")
+@app_commands.default_permissions(administrator=True)  # Restricts visibility to admins
+async def show_analytics(interaction: Interaction, top: app_commands.Range[int, 1, 20] = 10, min_picks: app_commands.Range[int, 1] = 10):
+    await interaction.response.defer(ephemeral=True)
+    started = time.perf_counter()
+    matrix = await async_database.get_pick_matrix()
+    loaded = time.perf_counter()
+    overall = analytics.gambler_stats(matrix)
+    by_field = analytics.stats_by_field(matrix)
+    computed = time.perf_counter()
+
+    lines = [f"**By field** ({matrix.picks.shape[0]} gamblers, {matrix.settled.sum()} settled of {len(matrix.bet_ids)} bets)"]
+    field_total, field_correct, field_payoff = by_field.total.sum(axis=0), by_field.correct.sum(axis=0), by_field.payoff.sum(axis=0)
+    for column, field in enumerate(by_field.labels):
+        if field_total[column]:
+            lines.append(
+                f"- {field}: {field_total[column]} picks, {field_correct[column] / field_total[column]:.1%} hit rate, "
+                f"{field_payoff[column] / field_total[column]:+.1%} ROI"
+            )
+
+    eligible = np.flatnonzero(overall.total[:, 0] >= min_picks)
+    ranked = eligible[np.argsort(-overall.roi[eligible, 0], kind="stable")][:top]
+    lines.append(f"**Top {len(ranked)} by ROI** (at least {min_picks} settled picks)")
+    for position, index in enumerate(ranked, start=1):
+        lines.append(
+            f"{position}. {matrix.names[index]}: {overall.roi[index, 0]:+.1%} ROI, "
+            f"{overall.hit_rate[index, 0]:.1%} hit rate over {overall.total[index, 0]} picks"
+        )
+    lines.append(f"-# Loaded in {(loaded - started) * 1000:.0f} ms, computed in {(computed - loaded) * 1000:.1f} ms")
+    await interaction.followup.send("\n".join(lines)[:2000], ephemeral=True)
+
+@bot.tree.command(name="week_outlook", description="Simulate the rest of a week: everyone's chance to finish first or top three.")
+@app_commands.describe(week="The week to simulate.", scenarios="How many outcomes of the open bets to simulate.")
+@app_commands.default_permissions(administrator=True)  # Restricts visibility to admins
+async def week_outlook(interaction: Interaction, week: int, scenarios: app_commands.Range[int, 1000, 1_000_000] = 100_000):
+    await interaction.response.defer(ephemeral=True)
+    started = time.perf_counter()
+    state = await async_database.get_week_state(week_number=week)
+    outlook = await simulation.simulate_week(state, scenarios=scenarios)
+    elapsed = time.perf_counter() - started
+
+    contenders = np.flatnonzero(outlook.top3 > 0)
+    contenders = contenders[np.lexsort((-outlook.top3[contenders], -outlook.top1[contenders]))][:20]
+    lines = [
+        f"**Week #{week} outlook**: {len(state.bet_ids)} open bets, {outlook.scenarios:,} scenarios" if len(state.bet_ids)
+        else f"**Week #{week} outlook**: no open bets, the standings are final"
+    ]
+    for index in contenders:
+        lines.append(
+            f"- {state.names[index]} ({state.payoff[index]:+.2f} so far): "
+            f"{outlook.top1[index]:.1%} to win, {outlook.top3[index]:.1%} top three"
+        )
+    if len(contenders) == 0:
+        lines.append("There are no gamblers yet.")
+    lines.append(f"-# {int((outlook.top3 > 0).sum())} gamblers can still reach the top three. Simulated in {elapsed:.2f} s")
+    await interaction.followup.send("\n".join(lines)[:2000], ephemeral=True)
+
+@bot.tree.command(name="herd", description="Show how alike the gamblers pick: closest pairs, followers and contrarians.")
+@app_commands.describe(min_common="Only count pairs that picked at least this many of the same bets.")
+@app_commands.default_permissions(administrator=True)  # Restricts visibility to admins
+async def herd_report(interaction: Interaction, min_common: app_commands.Range[int, 1] = 20):
+    await interaction.response.defer(ephemeral=True)
+    started = time.perf_counter()
+    # Popcounts over every pair of gamblers; run off the event loop
+    gambler_ids, same, common = await asyncio.to_thread(pick_bitsets.agreement_matrix)
+    elapsed = time.perf_counter() - started
+    names = {gambler.id: gambler.name for gambler in await async_database.get_all_gamblers()}
+
+    np.fill_diagonal(common, 0)
+    np.fill_diagonal(same, 0)
+    counted = common >= min_common
+    if not np.triu(counted).any():
+        await interaction.followup.send(f"No two gamblers have picked {min_common} of the same bets yet.", ephemeral=True)
+        return
+    rates = np.divide(same, common, out=np.zeros(same.shape), where=counted)
+    pooled = same[counted].sum() / common[counted].sum()
+
+    first, second = np.nonzero(np.triu(counted))
+    closest = np.argsort(-rates[first, second], kind="stable")[:5]
+    lines = [f"**Herd report**: {pooled:.1%} of shared picks agree, over {len(first)} pairs with at least {min_common} shared bets"]
+    lines.append("**Most alike pairs**")
+    for pair in closest:
+        a, b = first[pair], second[pair]
+        lines.append(
+            f"- {names.get(gambler_ids[a], gambler_ids[a])} & {names.get(gambler_ids[b], gambler_ids[b])}: "
+            f"{rates[a, b]:.1%} of {common[a, b]} bets"
+        )
+
+    # A gambler's agreement with everyone they share enough bets with
+    shared = np.where(counted, common, 0).sum(axis=1)
+    ranked = np.flatnonzero(shared > 0)
+    following = np.where(counted, same, 0).sum(axis=1)[ranked] / shared[ranked]
+    order = ranked[np.argsort(-following, kind="stable")]
+    rate_of = dict(zip(ranked, following))
+    lines.append("**Followers**")
+    lines += [f"- {names.get(gambler_ids[i], gambler_ids[i])}: agrees {rate_of[i]:.1%} of the time" for i in order[:5]]
+    lines.append("**Contrarians**")
+    lines += [f"- {names.get(gambler_ids[i], gambler_ids[i])}: agrees {rate_of[i]:.1%} of the time" for i in order[::-1][:5]]
+    lines.append(f"-# {len(gambler_ids)} gamblers compared in {elapsed * 1000:.0f} ms")
+    await interaction.followup.send("\n".join(lines)[:2000], ephemeral=True)
+
+
 # ------------------------------- SIDE METHODS FOR SLASH COMMANDS -------------------------------#
 
 async def process_bet(interaction: Interaction, gambler_id: int, bet_id: int, bet_on: int, skip_timecheck: bool=False):
     try:
-        gambler: Gambler = database.get_gambler(gambler_dc_id=gambler_id)
-        bet: Bet = database.get_bet(bet_id=bet_id)
+        gambler: Gambler = await async_database.get_gambler(gambler_dc_id=gambler_id)
+        bet: Bet = await async_database.get_bet(bet_id=bet_id)
 
         # Place or update the bet on behalf of the gambler
-        betcomment = database.link_gambler_to_bet(gambler_id=gambler_id, bet_id=bet_id, bet_on=bet_on, skip_timecheck=skip_timecheck)
+        betcomment = await async_database.link_gambler_to_bet(gambler_id=gambler_id, bet_id=bet_id, bet_on=bet_on, skip_timecheck=skip_timecheck)
+        pick_count_updater.pick_placed(interaction.client, bet_id)
 
         # Prepare the fancy response
         bet_placed = (
@@ -670,35 +1076,26 @@ async def process_bet(interaction: Interaction, gambler_id: int, bet_id: int, be
         # Respond publicly in the channel
         await interaction.response.send_message(embed=embed)
 
-        # Send a private message to the gambler
-        user = await interaction.client.fetch_user(gambler_id)
-        if user:
-            dm_embed = Embed(
-                title="📩 Bet Confirmation",
-                description=(
-                    f"Hi {gambler.name}, your bet has been placed successfully!\n\n"
-                    f"**Match:** {bet.home_team} vs {bet.away_team}\n"
-                    f"✅ **Your Bet:** {bet_placed}\n\n"
-                    "Good luck and stay tuned for the results!"
-                ),
-                color=Colour.blue()
-            )
-            await user.send(embed=dm_embed)
+        # Queue a private message to the gambler; a newer pick on the same bet replaces it
+        dm_embed = Embed(
+            title="📩 Bet Confirmation",
+            description=(
+                f"Hi {gambler.name}, your bet has been placed successfully!\n\n"
+                f"**Match:** {bet.home_team} vs {bet.away_team}\n"
+                f"✅ **Your Bet:** {bet_placed}\n\n"
+                "Good luck and stay tuned for the results!"
+            ),
+            color=Colour.blue()
+        )
+        outbound.send_dm(interaction.client, gambler_id, embed=dm_embed, coalesce_key=("bet", bet_id), interaction=interaction)
 
     except Exception as e:
         await interaction.response.send_message(f"❌ Error: {str(e)}", ephemeral=True)
 
 
 async def update_leaderboard(interaction: Interaction, week: int):
-    gamblers: List[Gambler] = database.get_all_gamblers()
-
-    gamblers = [gambler for gambler in gamblers if gambler.total / database.get_all_bets_count() > 0.4]
-    # Sort gamblers globally based on total payoff
-    gamblers.sort(key=lambda g: g.payoff, reverse=True)
-    global_ranks = {gambler.id: rank + 1 for rank, gambler in enumerate(gamblers)}
-
-    # Retrieve weekly stats for the specified week
-    weekly_stats = database.get_weekly_stats(week_number=week)
+    # Weekly and global standings are kept up to date by settlement; this is one ordered read
+    rows = await async_database.get_leaderboard(week_number=week)
 
     # Prepare leaderboard channel
     leaderboard_channel = interaction.guild.get_channel(ID.Channels.LEADERBOARD)
@@ -717,49 +1114,104 @@ async def update_leaderboard(interaction: Interaction, week: int):
     leaderboard_content += "+---------------------------------------------------------------------------+\n"
 
     # Populate leaderboard with weekly and global stats
-    for weekly_rank, stat in enumerate(weekly_stats, start=1):
-        gambler = next((g for g in gamblers if g.id == stat.gambler_id), None)
-        if not gambler:
-            continue
-
-        global_rank = global_ranks.get(gambler.id, "-")
+    for row in rows:
         weekly_win_rate = (
-            f"{round(stat.correct / stat.total * 100, 1):.1f}%" if stat.total > 0 else "0.0%"
+            f"{round(row.weekly_correct / row.weekly_total * 100, 1):.1f}%" if row.weekly_total > 0 else "0.0%"
         )
-        weekly_stats = f"{stat.total}|{stat.correct}-{stat.total - stat.correct}"
-        global_stats = f"{gambler.total}|{gambler.correct}-{gambler.total - gambler.correct}"
+        weekly_stats = f"{row.weekly_total}|{row.weekly_correct}-{row.weekly_total - row.weekly_correct}"
+        global_stats = f"{row.global_total}|{row.global_correct}-{row.global_total - row.global_correct}"
 
         # Weekly and global parts
-        leaderboard_row = f"{weekly_rank:<7}{stat.name[:13]:<13}{stat.payoff:<8.2f}{weekly_win_rate:<8}{weekly_stats:<10} | {global_rank:<8}{gambler.payoff:<8.2f}{global_stats:<10}\n"
+        leaderboard_row = f"{row.weekly_rank:<7}{row.name[:13]:<13}{row.weekly_payoff:<8.2f}{weekly_win_rate:<8}{weekly_stats:<10} | {row.global_rank:<8}{row.global_payoff:<8.2f}{global_stats:<10}\n"
 
         # Add row to content
         leaderboard_content += leaderboard_row
 
     leaderboard_content += "+---------------------------------------------------------------------------+\n```"
 
-    # Check for an existing leaderboard message
-    async for message in leaderboard_channel.history(limit=100):  # Adjust limit as needed
-        if (
-            message.author == interaction.client.user
-            and f"LEADERBOARD (Week #{week})" in message.content
-        ):
-            # Update the existing message
+    # Skip the edit entirely if the rendered leaderboard has not changed
+    content_hash = hashlib.sha256(leaderboard_content.encode()).hexdigest()
+    record = await async_database.get_leaderboard_message(guild_id=interaction.guild.id, week=week)
+    if record and record.channel_id == leaderboard_channel.id and record.content_hash == content_hash:
+        return
+
+    message = None
+    if record and record.channel_id == leaderboard_channel.id:
+        # Edit the stored message directly, without fetching it first
+        message = leaderboard_channel.get_partial_message(record.message_id)
+    elif not record:
+        # Adopt a leaderboard posted before its message ID was stored
+        async for old_message in leaderboard_channel.history(limit=100):
+            if (
+                old_message.author == interaction.client.user
+                and f"LEADERBOARD (Week #{week})" in old_message.content
+            ):
+                message = old_message
+                break
+
+    try:
+        if message:
             await message.edit(content=leaderboard_content)
-            return
+    except discord.NotFound:
+        message = None
 
     # If no message exists for the current week, create a new one
-    await leaderboard_channel.send(leaderboard_content)
+    if message is None:
+        message = await leaderboard_channel.send(leaderboard_content)
+
+    await async_database.set_leaderboard_message(
+        guild_id=interaction.guild.id,
+        week=week,
+        channel_id=leaderboard_channel.id,
+        message_id=message.id,
+        content_hash=content_hash,
+    )
+
+
+async def announce_bet(channel, bet: Bet):
+    """Posts a bet's announcement with its buttons and starts watching its deadline."""
+    bet_message: Message = await channel.send(embed=EmbedMessages.bet_created_announcement(bet), view=BetButtons(bet))
+    await async_database.set_bet_message_id(bet.id, bet_message.id)
+    deadline_scheduler.schedule(bet.id, bet.deadline)
+
+
+def result_announcement(settlement: BetSettlement) -> str:
+    bet = settlement.bet
+    result_text = (
+        f"🎉 **Match Result Announcement!** 🎉\n\n"
+        f"🏟️ **Field:** {bet.field}\n"
+        f"⚽ **Match:** `{bet.home_team}` vs `{bet.away_team}`\n"
+    )
+    result_text += (
+        f"🏆 **Final Result:** `{bet.home_team}` Wins 🏠\n"
+        if bet.winning_odd == 1
+        else "🏆 **Final Result:** `Draw` 🤝\n"
+        if bet.winning_odd == 0
+        else f"🏆 **Final Result:** `{bet.away_team}` Wins 🚩\n"
+    )
+
+    # Add gamblers' outcomes
+    result_text += "\n📊 **Gamblers Performance:**\n"
+    for gambler_result in settlement.lines():
+        result_text += f"- {gambler_result}\n"
+    return result_text
 
 
-async def send_split_message(channel, content):
+def send_split_message(channel, content):
+    # Queued in order on the channel's route; returns before anything is sent.
+    # Pages end at the last line break that fits, so lines are not cut in half.
     MAX_CONTENT_LENGTH = 2000
-    for i in range(0, len(content), MAX_CONTENT_LENGTH):
-        await channel.send(content[i : i + MAX_CONTENT_LENGTH])
+    while content:
+        page = content[:MAX_CONTENT_LENGTH]
+        if len(content) > MAX_CONTENT_LENGTH and "\n" in page:
+            page = page[: page.rindex("\n") + 1]
+        outbound.send_to_channel(channel, page)
+        content = content[len(page):]
 
 
 async def isRegisteredUser(interaction: Interaction) -> bool:
     try:
-        gambler = database.get_gambler(gambler_dc_id=interaction.user.id)
+        gambler = await async_database.get_gambler(gambler_dc_id=interaction.user.id)
         return True
     except KeyError:
         await interaction.response.send_message(
@@ -817,5 +1269,6 @@ async def isCorrectOdd(interaction: Interaction, odd: str) -> bool | float:
     return odd
 
 
-# Run the bot
-bot.run(token)
+# Run the bot (not in the simulation's worker processes where they are spawned)
+if __name__ == "__main__":
+    bot.run(token)
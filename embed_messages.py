@@ -1,9 +1,11 @@
 from datetime import datetime, timezone
-from discord import Interaction, Embed, Colour, ButtonStyle
-from discord.ui import Button, View
-from database import Gambler, Bet
-import database
-from settings import Emoji
+from discord import Client, Interaction, Embed, Colour, ButtonStyle
+from discord.ui import Button, DynamicItem, View
+from database import Gambler, Bet, open_bets, pick_counts
+from open_bets import OpenBet
+import async_database
+import outbound
+from settings import Emoji, ID
 
 class EmbedMessages:
     @classmethod
@@ -23,7 +25,7 @@ class EmbedMessages:
         return embed
     
     @classmethod
-    def bet_created_announcement(cls, bet: Bet) -> Embed:
+    def bet_created_announcement(cls, bet: Bet, pick_counts: dict[int, int] | None = None) -> Embed:
         embed = Embed(
             title="⚽ New Match Announcement ⚽",
             description=(
@@ -35,6 +37,12 @@ class EmbedMessages:
             ),
             color=Colour.blue(),
         )
+        if pick_counts is not None:
+            embed.add_field(
+                name="📊 Picks so far",
+                value=f"{Emoji.HOME} {pick_counts[1]}  |  {Emoji.DRAW} {pick_counts[0]}  |  {Emoji.AWAY} {pick_counts[2]}",
+                inline=False,
+            )
         embed.set_footer(text="Use the buttons below to place your bet!")
         return embed
     
@@ -54,68 +62,103 @@ class EmbedMessages:
         embed.set_footer(text="Keep in touch to get notified for the future matchs!")
         return embed
 
-class BetButtons(View):
-    def __init__(self, bet: Bet):
-        super().__init__(timeout=None)
-        self.bet = bet
-        
-        # Check if the deadline has passed
-        self.is_disabled = datetime.now(timezone.utc) >= bet.deadline.astimezone(timezone.utc)
+class PickCountUpdater:
+    """
+    Shows the live pick counts on the announcements. Picks only trigger a refresh; the
+    edits are debounced to at most one per bet every `interval` seconds and sent through
+    the outbound queue, so a click storm never turns into an edit storm.
+    """
+    def __init__(self, interval: float = 5.0):
+        self.debouncer = outbound.Debouncer(self._edit, interval)
+        self._client: Client | None = None
 
-        self.home_button = Button(label=bet.home_team, style=ButtonStyle.primary, custom_id=f"{bet.id}_1", emoji=Emoji.HOME, disabled=self.is_disabled)
-        self.draw_button = Button(label="Draw", style=ButtonStyle.primary, custom_id=f"{bet.id}_0", emoji=Emoji.DRAW, disabled=self.is_disabled)
-        self.away_button = Button(label=bet.away_team, style=ButtonStyle.primary, custom_id=f"{bet.id}_2", emoji=Emoji.AWAY, disabled=self.is_disabled)
-        self.withdraw_button = Button(label="Withdraw", style=ButtonStyle.danger, custom_id=f"{bet.id}_3", emoji=Emoji.WITHDRAW, disabled=self.is_disabled)
+    def pick_placed(self, client: Client, bet_id: int):
+        self._client = client
+        self.debouncer.trigger(bet_id)
+
+    async def _edit(self, bet_id: int):
+        # Closed bets keep the embed they got at their deadline
+        bet = open_bets.get(bet_id)
+        channel = self._client.get_channel(ID.Channels.MAC_BILDIRIM) if self._client else None
+        if not bet or not bet.message_id or not channel:
+            return
+        message = channel.get_partial_message(bet.message_id)
+        embed = EmbedMessages.bet_created_announcement(bet, pick_counts.get(bet_id))
+        outbound.edit_message(message, coalesce_key="pick_counts", embed=embed)
 
-        self.add_item(self.home_button)
-        self.add_item(self.draw_button)
-        self.add_item(self.away_button)
-        self.add_item(self.withdraw_button)
+pick_count_updater = PickCountUpdater()
 
-        self.home_button.callback = self.on_bet_button_click
-        self.draw_button.callback = self.on_bet_button_click
-        self.away_button.callback = self.on_bet_button_click
-        self.withdraw_button.callback = self.on_bet_button_click
+class BetButton(DynamicItem[Button], template=r"(?P<bet_id>[0-9]+)_(?P<bet_on>[0-3])"):
+    """
+    Stateless handler for every bet announcement button. The "{bet_id}_{bet_on}" custom_id
+    carries all the state, so one registration with bot.add_dynamic_items serves the
+    buttons of every announcement ever posted and the bet is only looked up when clicked.
+    """
+    def __init__(self, bet_id: int, bet_on: int, button: Button | None = None):
+        super().__init__(button or Button(custom_id=f"{bet_id}_{bet_on}"))
+        self.bet_id = bet_id
+        self.bet_on = bet_on
 
-    async def on_bet_button_click(self, interaction: Interaction):
+    @classmethod
+    async def from_custom_id(cls, interaction: Interaction, item: Button, match):
+        return cls(int(match["bet_id"]), int(match["bet_on"]), item)
+
+    async def callback(self, interaction: Interaction):
         # Acknowledge interaction early
         await interaction.response.defer(ephemeral=True)
 
         gambler_id = interaction.user.id
-        gambler = database.get_gambler(gambler_id)
-        bet_id, button_label = interaction.data['custom_id'].split('_')
-        bet_id = int(bet_id)
-        bet_on = int(button_label)
+        bet_id, bet_on = self.bet_id, self.bet_on
+        try:
+            bet = open_bets.get(bet_id) or await async_database.get_bet(bet_id)
+        except KeyError:
+            await interaction.followup.send("This bet does not exist anymore.", ephemeral=True)
+            return
+
+        # Reject clicks on started or settled matches without touching the database
+        if open_bets.loaded and not open_bets.is_open(bet_id):
+            error_embed = Embed(
+                title="📩 Bet Confirmation",
+                description=(
+                    f"{Emoji.X} Hi {interaction.user.display_name}, your bet has failed because "
+                    "You are too late to place a bet on this match. Try another one.\n\n"
+                    f"**Match:** {bet.home_team} vs {bet.away_team}\n"
+                ),
+                color=Colour.red()
+            )
+            await interaction.followup.send(embed=error_embed, ephemeral=True)
+            return
+
+        gambler = await async_database.get_gambler(gambler_id)
         try:
             # Link gambler to the bet
-            database.link_gambler_to_bet(gambler_id=gambler_id, bet_id=bet_id, bet_on=bet_on)
-            print(f"{gambler.name} | {self.bet.home_team} vs {self.bet.away_team} | {bet_on}")
+            await async_database.link_gambler_to_bet(gambler_id=gambler_id, bet_id=bet_id, bet_on=bet_on)
+            pick_count_updater.pick_placed(interaction.client, bet_id)
+            print(f"{gambler.name} | {bet.home_team} vs {bet.away_team} | {bet_on}")
             # Construct bet details
             bet_placed = (
-                f"🏠 **{self.bet.home_team}** ({self.bet.odd_1})" if bet_on == 1 else
-                f"🤝 **Draw** ({self.bet.odd_0})" if bet_on == 0 else
-                f"🚩 **{self.bet.away_team}** ({self.bet.odd_2})" if bet_on == 2 else
+                f"🏠 **{bet.home_team}** ({bet.odd_1})" if bet_on == 1 else
+                f"🤝 **Draw** ({bet.odd_0})" if bet_on == 0 else
+                f"🚩 **{bet.away_team}** ({bet.odd_2})" if bet_on == 2 else
                 "🏳️‍🌈 **Indecisive** (1.00)"
             )
 
-            # Send DM confirmation
-            user = await interaction.client.fetch_user(gambler_id)
+            # Confirm in the channel right away and queue the DM confirmation
             dm_embed = Embed(
                 title="📩 Bet Confirmation",
                 description=(
                     f"Hi {gambler.name}, your bet has been placed successfully!\n\n"
-                    f"**Match:** {self.bet.home_team} vs {self.bet.away_team}\n"
+                    f"**Match:** {bet.home_team} vs {bet.away_team}\n"
                     f"{Emoji.CHECK} **Your Bet:** {bet_placed}\n\n"
                     "Good luck and stay tuned for the results!"
                 ),
                 color=Colour.green()
             )
-            try:
-                await user.send(embed=dm_embed)
-                await interaction.followup.send(embed=dm_embed, ephemeral=True)
-            except Exception as e:
-                print(f"Failed to send DM to {user.name}: {e}")
+            await interaction.followup.send(embed=dm_embed, ephemeral=True)
+
+            async def dm_failed(error: Exception):
                 await interaction.followup.send("The BOT could not send you a DM. Please check your settings.", ephemeral=True)
+            outbound.send_dm(interaction.client, gambler_id, embed=dm_embed, coalesce_key=("bet", bet_id), on_failure=dm_failed, interaction=interaction)
 
         except ValueError as e:
             # Handle specific errors
@@ -123,7 +166,7 @@ class BetButtons(View):
                 title="📩 Bet Confirmation",
                 description=(
                     f"{Emoji.X} Hi {gambler.name}, your bet has failed because {e}\n\n"
-                    f"**Match:** {self.bet.home_team} vs {self.bet.away_team}\n"
+                    f"**Match:** {bet.home_team} vs {bet.away_team}\n"
                 ),
                 color=Colour.red()
             )
@@ -132,4 +175,23 @@ class BetButtons(View):
         except Exception as e:
             # Handle unexpected errors
             print(f"Unexpected error while placing bet: {e}")
-            await interaction.followup.send("An unexpected error occurred. Please try again later.", ephemeral=True)
\ No newline at end of file
+            await interaction.followup.send("An unexpected error occurred. Please try again later.", ephemeral=True)
+
+class BetButtons(View):
+    """The buttons attached to a bet announcement. Clicks are handled by BetButton."""
+    def __init__(self, bet: Bet | OpenBet, disabled: bool | None = None):
+        super().__init__(timeout=None)
+        self.bet = bet
+        
+        # Check if the deadline has passed
+        self.is_disabled = datetime.now(timezone.utc) >= bet.deadline.astimezone(timezone.utc) if disabled is None else disabled
+
+        self.home_button = Button(label=bet.home_team, style=ButtonStyle.primary, custom_id=f"{bet.id}_1", emoji=Emoji.HOME, disabled=self.is_disabled)
+        self.draw_button = Button(label="Draw", style=ButtonStyle.primary, custom_id=f"{bet.id}_0", emoji=Emoji.DRAW, disabled=self.is_disabled)
+        self.away_button = Button(label=bet.away_team, style=ButtonStyle.primary, custom_id=f"{bet.id}_2", emoji=Emoji.AWAY, disabled=self.is_disabled)
+        self.withdraw_button = Button(label="Withdraw", style=ButtonStyle.danger, custom_id=f"{bet.id}_3", emoji=Emoji.WITHDRAW, disabled=self.is_disabled)
+
+        self.add_item(BetButton(bet.id, 1, self.home_button))
+        self.add_item(BetButton(bet.id, 0, self.draw_button))
+        self.add_item(BetButton(bet.id, 2, self.away_button))
+        self.add_item(BetButton(bet.id, 3, self.withdraw_button))
@@ -0,0 +1,136 @@
+import threading
+from dataclasses import dataclass
+from typing import Iterable
+
+import numpy as np
+
+OUTCOMES = (0, 1, 2)  # Row index in the bitsets is the outcome itself
+WORD = 64
+
+@dataclass
+class HeadToHead:
+    common: int  # Bets both gamblers picked
+    same: int  # ... with the same outcome
+    decided: int  # Resulted bets on which they picked differently
+    won: int  # ... that the first gambler got right
+    lost: int  # ... that the second gambler got right
+
+    @property
+    def agreement(self) -> float:
+        return self.same / self.common if self.common else 0.0
+
+class PickBitsets:
+    """
+    Every gambler's picks as three bitsets, one per outcome, with one bit per bet that is
+    set if the gambler picked that outcome. Results are kept the same way. Comparing
+    two gamblers is then a handful of ANDs and popcounts over bets/64 words, and the
+    all-pairs agreement matrix needs no join at all. Loaded once and then kept current by
+    database.py as picks and results are committed.
+    """
+    def __init__(self):
+        self.loaded = False
+        self._rows: dict[int, int] = {}  # gambler_id -> row
+        self._columns: dict[int, int] = {}  # bet_id -> bit
+        self._picks = np.zeros((3, 0, 1), dtype=np.uint64)  # (outcome, gambler, word)
+        self._results = np.zeros((3, 1), dtype=np.uint64)  # (outcome, word)
+        self._lock = threading.Lock()
+
+    def load(self, picks: Iterable[tuple[int, int, int]], results: Iterable[tuple[int, int]]) -> int:
+        """Replaces the bitsets with (gambler_id, bet_id, bet_on) and (bet_id, result) rows. Returns how many picks were loaded."""
+        picked = np.fromiter(picks, dtype=[("gambler", "i8"), ("bet", "i8"), ("bet_on", "i1")])
+        picked = picked[np.isin(picked["bet_on"], OUTCOMES)]
+        resulted = np.fromiter(results, dtype=[("bet", "i8"), ("result", "i1")])
+        resulted = resulted[np.isin(resulted["result"], OUTCOMES)]
+
+        gambler_ids = np.unique(picked["gambler"])
+        bet_ids = np.unique(np.concatenate([picked["bet"], resulted["bet"]]))
+        words = len(bet_ids) // WORD + 1
+        flags = np.zeros((3, len(gambler_ids), words * WORD), dtype=bool)
+        flags[picked["bet_on"], np.searchsorted(gambler_ids, picked["gambler"]), np.searchsorted(bet_ids, picked["bet"])] = True
+        result_flags = np.zeros((3, words * WORD), dtype=bool)
+        result_flags[resulted["result"], np.searchsorted(bet_ids, resulted["bet"])] = True
+
+        with self._lock:
+            # Little-endian bit order puts bit n at bit n % 64 of word n // 64
+            self._picks = np.packbits(flags, axis=-1, bitorder="little").view("<u8")
+            self._results = np.packbits(result_flags, axis=-1, bitorder="little").view("<u8")
+            self._rows = {int(gambler_id): row for row, gambler_id in enumerate(gambler_ids)}
+            self._columns = {int(bet_id): column for column, bet_id in enumerate(bet_ids)}
+            self.loaded = True
+        return len(picked)
+
+    def _bit(self, bet_id: int) -> tuple[int, np.uint64]:
+        # Returns the word and mask of a bet's bit; a new bet gets the next bit, doubling the bitsets when full
+        if bet_id not in self._columns:
+            self._columns[bet_id] = len(self._columns)
+            words = len(self._columns) // WORD + 1
+            if words > self._picks.shape[2]:
+                grow = max(words, 2 * self._picks.shape[2]) - self._picks.shape[2]
+                self._picks = np.pad(self._picks, ((0, 0), (0, 0), (0, grow)))
+                self._results = np.pad(self._results, ((0, 0), (0, grow)))
+        column = self._columns[bet_id]
+        return column // WORD, np.uint64(1 << column % WORD)
+
+    def _row(self, gambler_id: int) -> int:
+        if gambler_id not in self._rows:
+            self._rows[gambler_id] = self._picks.shape[1]
+            self._picks = np.pad(self._picks, ((0, 0), (0, 1), (0, 0)))
+        return self._rows[gambler_id]
+
+    def apply(self, gambler_id: int, bet_id: int, old_bet_on: int | None, new_bet_on: int | None):
+        """Moves one pick from `old_bet_on` to `new_bet_on`; None means no pick."""
+        with self._lock:
+            if not self.loaded:
+                return
+            word, mask = self._bit(bet_id)
+            row = self._row(gambler_id)
+            if old_bet_on in OUTCOMES:
+                self._picks[old_bet_on, row, word] &= ~mask
+            if new_bet_on in OUTCOMES:
+                self._picks[new_bet_on, row, word] |= mask
+
+    def settle(self, bet_id: int, result: int):
+        """Records (or corrects) the result of a bet."""
+        with self._lock:
+            if not self.loaded:
+                return
+            word, mask = self._bit(bet_id)
+            self._results[:, word] &= ~mask
+            self._results[result, word] |= mask
+
+    def head_to_head(self, gambler_id: int, opponent_id: int) -> HeadToHead:
+        with self._lock:
+            empty = np.zeros((3, self._picks.shape[2]), dtype=np.uint64)
+            mine = self._picks[:, self._rows[gambler_id]].copy() if gambler_id in self._rows else empty
+            theirs = self._picks[:, self._rows[opponent_id]].copy() if opponent_id in self._rows else empty
+            results = self._results.copy()
+
+        count = lambda bits: int(np.bitwise_count(bits).sum())
+        common = np.bitwise_or.reduce(mine, axis=0) & np.bitwise_or.reduce(theirs, axis=0)
+        same = np.bitwise_or.reduce(mine & theirs, axis=0)
+        decided = common & ~same & np.bitwise_or.reduce(results, axis=0)
+        won = np.bitwise_or.reduce(mine & results, axis=0) & decided
+        lost = np.bitwise_or.reduce(theirs & results, axis=0) & decided
+        return HeadToHead(count(common), count(same), count(decided), count(won), count(lost))
+
+    def agreement_matrix(self, budget: int = 1 << 25) -> tuple[list[int], np.ndarray, np.ndarray]:
+        """
+        Returns (gambler_ids, same, common) where common[a, b] is how many bets gamblers a
+        and b both picked and same[a, b] how many of those they picked alike. Rows are
+        processed in blocks so the intermediate stays under `budget` bytes.
+        """
+        with self._lock:
+            gambler_ids = sorted(self._rows, key=self._rows.get)
+            picks = self._picks.copy()
+
+        gamblers, words = picks.shape[1], picks.shape[2]
+        picked = np.bitwise_or.reduce(picks, axis=0)  # (g, w)
+        same = np.zeros((gamblers, gamblers), dtype=np.int64)
+        common = np.zeros((gamblers, gamblers), dtype=np.int64)
+        block = max(1, budget // max(1, gamblers * words * 8))
+        for start in range(0, gamblers, block):
+            rows = slice(start, start + block)
+            common[rows] = np.bitwise_count(picked[rows, None, :] & picked[None, :, :]).sum(axis=-1, dtype=np.int64)
+            for outcome in OUTCOMES:
+                same[rows] += np.bitwise_count(picks[outcome, rows, None, :] & picks[outcome, None, :, :]).sum(axis=-1, dtype=np.int64)
+        return gambler_ids, same, common
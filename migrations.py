@@ -0,0 +1,186 @@
+from datetime import datetime, timezone
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, select, text
+from sqlalchemy.engine import Connection, Engine
+import ratings
+from settings import Constant
+
+# Applied migrations are recorded here, separately from the application's metadata
+version_metadata = MetaData()
+schema_version_table = Table(
+    'schema_version', version_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String, nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+def _create_indexes(connection: Connection, metadata: MetaData, *names: str):
+    indexes = {index.name: index for table in metadata.tables.values() for index in table.indexes}
+    for name in names:
+        indexes[name].create(connection, checkfirst=True)
+
+def _create_tables(connection: Connection, metadata: MetaData, *names: str):
+    for name in names:
+        metadata.tables[name].create(connection, checkfirst=True)
+
+def _initial_schema(connection: Connection, metadata: MetaData):
+    # Fresh databases get every table at once; existing ones only the missing tables
+    metadata.create_all(connection)
+
+def _weekly_statistics_upsert_key(connection: Connection, metadata: MetaData):
+    _create_indexes(connection, metadata, 'ix_weekly_statistics_week_gambler')
+
+def _hot_query_indexes(connection: Connection, metadata: MetaData):
+    _create_indexes(
+        connection, metadata,
+        'ix_gambler_bet_bet',
+        'ix_bets_week',
+        'ix_bets_result_deadline',
+        'ix_bets_message_id',
+        'ix_settlement_log_bet_id',
+        'ix_weekly_statistics_week_payoff',
+    )
+
+def _bet_id_sequence(connection: Connection, metadata: MetaData):
+    _create_tables(connection, metadata, 'id_sequences')
+
+def _bets_search_index(connection: Connection, metadata: MetaData):
+    # Trigram full-text index over the searchable bet columns (needs SQLite 3.34+).
+    # Triggers keep it in sync with bets; results and message IDs do not touch it.
+    statements = [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS bets_search USING fts5(
+            home_team, away_team, field,
+            content='bets', content_rowid='id', tokenize='trigram'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS bets_search_insert AFTER INSERT ON bets BEGIN
+            INSERT INTO bets_search(rowid, home_team, away_team, field)
+            VALUES (new.id, new.home_team, new.away_team, new.field);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS bets_search_delete AFTER DELETE ON bets BEGIN
+            INSERT INTO bets_search(bets_search, rowid, home_team, away_team, field)
+            VALUES ('delete', old.id, old.home_team, old.away_team, old.field);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS bets_search_update AFTER UPDATE OF id, home_team, away_team, field ON bets BEGIN
+            INSERT INTO bets_search(bets_search, rowid, home_team, away_team, field)
+            VALUES ('delete', old.id, old.home_team, old.away_team, old.field);
+            INSERT INTO bets_search(rowid, home_team, away_team, field)
+            VALUES (new.id, new.home_team, new.away_team, new.field);
+        END
+        """,
+        "INSERT INTO bets_search(bets_search) VALUES ('rebuild')",
+    ]
+    for statement in statements:
+        connection.execute(text(statement))
+
+def _settlement_ledger(connection: Connection, metadata: MetaData):
+    # Backfills one row per pick on every resulted bet. The stored counters already include
+    # them, so the materialization checkpoint starts after the backfilled rows.
+    _create_tables(connection, metadata, 'settlement_ledger', 'checkpoints')
+    if connection.scalar(text("SELECT COUNT(*) FROM settlement_ledger")):
+        return
+    connection.execute(text("""
+        INSERT INTO settlement_ledger
+            (gambler_id, bet_id, week, bet_on, winning_odd, correct, wrong, total, payoff, created_at)
+        SELECT gb.gambler_id, gb.bet_id, b.week, gb.bet_on, b.winning_odd,
+               gb.bet_on = b.winning_odd,
+               gb.bet_on != b.winning_odd,
+               1,
+               CASE WHEN gb.bet_on != b.winning_odd THEN 0
+                    WHEN b.winning_odd = 1 THEN b.odd_1
+                    WHEN b.winning_odd = 0 THEN b.odd_0
+                    ELSE b.odd_2 END - 1,
+               CURRENT_TIMESTAMP
+        FROM gambler_bet gb JOIN bets b ON b.id = gb.bet_id
+        WHERE b.winning_odd IS NOT NULL
+        ORDER BY b.deadline, gb.bet_id, gb.gambler_id
+    """))
+    connection.execute(text("""
+        INSERT INTO checkpoints (name, seq)
+        VALUES ('ledger', (SELECT COALESCE(MAX(seq), 0) FROM settlement_ledger))
+        ON CONFLICT (name) DO UPDATE SET seq = excluded.seq
+    """))
+
+def _leaderboard(connection: Connection, metadata: MetaData):
+    # Filled from the stored counters; the bot keeps it up to date from then on
+    _create_tables(connection, metadata, 'leaderboard')
+    connection.execute(text("""
+        INSERT OR REPLACE INTO leaderboard (gambler_id, name, rank, ratio, payoff, correct, wrong, total)
+        SELECT id, name,
+               CASE WHEN eligible THEN RANK() OVER (PARTITION BY eligible ORDER BY payoff DESC) END,
+               ratio, payoff, correct, wrong, total
+        FROM (
+            SELECT id, name, ratio, ratio > :min_ratio AS eligible,
+                   COALESCE(payoff, 0.0) AS payoff, COALESCE(correct, 0) AS correct,
+                   COALESCE(wrong, 0) AS wrong, COALESCE(total, 0) AS total
+            FROM (
+                SELECT *, COALESCE(COALESCE(total, 0) * 1.0 / NULLIF((SELECT COUNT(*) FROM bets), 0), 0.0) AS ratio
+                FROM gamblers
+            )
+        )
+    """), {"min_ratio": Constant.LEADERBOARD_MIN_RATIO})
+
+def _leaderboard_messages(connection: Connection, metadata: MetaData):
+    _create_tables(connection, metadata, 'leaderboard_messages')
+
+def _app_state(connection: Connection, metadata: MetaData):
+    _create_tables(connection, metadata, 'app_state')
+
+def _ratings(connection: Connection, metadata: MetaData):
+    # Unlike the other migrations this one runs live code: ratings are derived data, and
+    # the settlement hook keeps updating them with the current ratings.py, so the initial
+    # replay must use that same code. A change to the rating formula is released with a
+    # new migration that calls ratings.rebuild again, instead of by editing this one.
+    _create_tables(connection, metadata, 'ratings')
+    ratings.rebuild(connection)
+
+def _closed_bets(connection: Connection, metadata: MetaData):
+    # The checkpoint could skip a bet that failed to close before a later one; without it,
+    # the next startup closes every past-deadline announcement again, once
+    _create_tables(connection, metadata, 'closed_bets')
+    connection.execute(text("DELETE FROM app_state WHERE name = 'closed_deadline'"))
+
+# Append new migrations at the end; never edit or reorder the ones already released.
+# Each one must also work on a database whose tables were just made by _initial_schema.
+MIGRATIONS = [
+    (1, "initial schema", _initial_schema),
+    (2, "unique (week_num, gambler_id) on weekly_statistics", _weekly_statistics_upsert_key),
+    (3, "indexes for the hot bet, pick and leaderboard queries", _hot_query_indexes),
+    (4, "id_sequences table for the bet ID allocator", _bet_id_sequence),
+    (5, "bets_search full-text index for bet autocomplete", _bets_search_index),
+    (6, "settlement_ledger backfilled from the resulted bets", _settlement_ledger),
+    (7, "leaderboard table with the global standings", _leaderboard),
+    (8, "leaderboard_messages table with the posted leaderboard per guild and week", _leaderboard_messages),
+    (9, "app_state key-value table", _app_state),
+    (10, "ratings table replayed from the settlement ledger", _ratings),
+    (11, "closed_bets table replacing the closed_deadline checkpoint", _closed_bets),
+]
+
+def current_version(connection: Connection) -> int:
+    return connection.scalar(select(func.max(schema_version_table.c.version))) or 0
+
+def run_migrations(engine: Engine, metadata: MetaData) -> list[int]:
+    """
+    Applies every migration newer than the database's schema version, each in its own
+    transaction. Returns the versions that were applied.
+    """
+    version_metadata.create_all(engine)
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        with engine.begin() as connection:
+            if version <= current_version(connection):
+                continue
+            migrate(connection, metadata)
+            connection.execute(schema_version_table.insert().values(
+                version=version,
+                description=description,
+                applied_at=datetime.now(timezone.utc),
+            ))
+        applied.append(version)
+        print(f"Applied migration {version}: {description}")
+    return applied
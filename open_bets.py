@@ -0,0 +1,168 @@
+import bisect
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Iterable
+
+def _utc_naive(moment: datetime) -> datetime:
+    # Deadlines are stored as naive UTC in SQLite, but freshly created bets still carry their tzinfo
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+@dataclass(frozen=True)
+class OpenBet:
+    """Read-only snapshot of a bet that can still be bet on."""
+    id: int
+    message_id: int | None
+    field: str
+    home_team: str
+    away_team: str
+    odd_1: float
+    odd_0: float
+    odd_2: float
+    deadline: datetime
+    week: int
+
+    @classmethod
+    def from_bet(cls, bet) -> "OpenBet":
+        return cls(
+            id=bet.id,
+            message_id=bet.message_id,
+            field=bet.field,
+            home_team=bet.home_team,
+            away_team=bet.away_team,
+            odd_1=bet.odd_1,
+            odd_0=bet.odd_0,
+            odd_2=bet.odd_2,
+            deadline=_utc_naive(bet.deadline),
+            week=bet.week,
+        )
+
+    def odd(self, outcome: int) -> float:
+        return {1: self.odd_1, 0: self.odd_0, 2: self.odd_2}.get(outcome, 1.0)
+
+class OpenBetsIndex:
+    """
+    Process-local index of unsettled bets whose deadline has not passed, ordered by
+    deadline. database.py keeps it up to date when bets are created, announced or settled,
+    and entries drop out on their own once their deadline passes. Safe to use from the
+    event loop and the DB executor thread at the same time.
+    """
+    def __init__(self):
+        self.loaded = False
+        self._bets: dict[int, OpenBet] = {}
+        self._by_deadline: list[tuple[datetime, int]] = []
+        self._lock = threading.Lock()
+
+    def load(self, bets: Iterable):
+        with self._lock:
+            self._bets.clear()
+            self._by_deadline.clear()
+            for bet in bets:
+                self._add(OpenBet.from_bet(bet))
+            self.loaded = True
+
+    def add(self, bet):
+        """Adds or refreshes a bet; ignored if it is settled or has already started."""
+        if bet.winning_odd is not None:
+            self.discard(bet.id)
+            return
+        with self._lock:
+            self._remove(bet.id)
+            self._add(OpenBet.from_bet(bet))
+
+    def discard(self, bet_id: int):
+        with self._lock:
+            self._remove(bet_id)
+
+    def get(self, bet_id: int) -> OpenBet | None:
+        with self._lock:
+            self._evict_expired()
+            return self._bets.get(bet_id)
+
+    def is_open(self, bet_id: int) -> bool:
+        return self.get(bet_id) is not None
+
+    def all(self) -> list[OpenBet]:
+        """Every open bet, soonest deadline first."""
+        with self._lock:
+            self._evict_expired()
+            return [self._bets[bet_id] for _, bet_id in self._by_deadline]
+
+    def search(self, query: str, limit: int = 25) -> list[OpenBet]:
+        """Open bets whose teams or field contain every word of `query`, soonest first."""
+        words = query.lower().split()
+        matches = []
+        for bet in self.all():
+            searchable = f"{bet.home_team} {bet.away_team} {bet.field}".lower()
+            if all(word in searchable for word in words):
+                matches.append(bet)
+                if len(matches) == limit:
+                    break
+        return matches
+
+    def evict_expired(self) -> list[int]:
+        with self._lock:
+            return self._evict_expired()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._evict_expired()
+            return len(self._bets)
+
+    def _add(self, bet: OpenBet):
+        if bet.deadline <= _utc_now():
+            return
+        self._bets[bet.id] = bet
+        bisect.insort(self._by_deadline, (bet.deadline, bet.id))
+
+    def _remove(self, bet_id: int):
+        bet = self._bets.pop(bet_id, None)
+        if bet:
+            self._by_deadline.remove((bet.deadline, bet_id))
+
+    def _evict_expired(self) -> list[int]:
+        now = _utc_now()
+        cutoff = bisect.bisect_right(self._by_deadline, (now, float("inf")))
+        expired = [bet_id for _, bet_id in self._by_deadline[:cutoff]]
+        del self._by_deadline[:cutoff]
+        for bet_id in expired:
+            del self._bets[bet_id]
+        return expired
+
+class PickCounts:
+    """
+    How many gamblers picked each outcome of a bet. Loaded once with one grouped query and
+    then kept current by database.py as picks are committed, so reading it never queries.
+    """
+    def __init__(self):
+        self._counts: dict[int, dict[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, rows: Iterable[tuple[int, int, int]]):
+        """Replaces the counts with (bet_id, bet_on, count) rows."""
+        with self._lock:
+            self._counts.clear()
+            for bet_id, bet_on, count in rows:
+                self._counts.setdefault(bet_id, {1: 0, 0: 0, 2: 0})[bet_on] = count
+
+    def apply(self, bet_id: int, old_bet_on: int | None, new_bet_on: int | None):
+        """Moves one pick from `old_bet_on` to `new_bet_on`; None means no pick."""
+        with self._lock:
+            counts = self._counts.setdefault(bet_id, {1: 0, 0: 0, 2: 0})
+            if old_bet_on in counts:
+                counts[old_bet_on] = max(0, counts[old_bet_on] - 1)
+            if new_bet_on in counts:
+                counts[new_bet_on] += 1
+
+    def get(self, bet_id: int) -> dict[int, int]:
+        with self._lock:
+            return dict(self._counts.get(bet_id, {1: 0, 0: 0, 2: 0}))
+
+    def discard(self, bet_id: int):
+        with self._lock:
+            self._counts.pop(bet_id, None)
@@ -0,0 +1,230 @@
+import asyncio
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Hashable
+
+import discord
+
+from users import user_resolver
+
+@dataclass
+class _Job:
+    route: str
+    send: Callable[[], Awaitable]
+    coalesce_key: Hashable | None = None
+    on_failure: Callable[[Exception], Awaitable] | None = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+class _RateBudget:
+    """Token bucket allowing `rate` sends per `per` seconds on one route."""
+    def __init__(self, rate: int, per: float):
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+        self.updated = now
+
+    async def acquire(self):
+        self._refill()
+        if self.tokens < 1:
+            await asyncio.sleep((1 - self.tokens) * self.per / self.rate)
+            self._refill()
+        self.tokens -= 1
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.rate
+
+class OutboundDispatcher:
+    """
+    Sends DMs and channel messages in the background so that interaction handlers only
+    enqueue and return. A bounded pool of workers drains the queue; messages for one route
+    (a DM channel or a text channel) go out in order, one at a time, within that route's
+    rate budget. Failed sends are retried with exponential backoff unless Discord rejected
+    them for good (403, 404, ...). A DM enqueued with the same `coalesce_key` as one still
+    waiting replaces it, so a gambler who changes their pick quickly gets one DM.
+    """
+    def __init__(self, workers: int = 4, max_pending: int = 1000, route_rate: int = 5, route_per: float = 5.0, max_attempts: int = 4, backoff: float = 1.0):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.route_rate = route_rate
+        self.route_per = route_per
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.latencies: deque[float] = deque(maxlen=1000)  # Seconds from enqueue to delivery
+
+        self._routes: dict[str, deque[_Job]] = {}
+        self._waiting: dict[Hashable, _Job] = {}
+        self._budgets: dict[str, _RateBudget] = {}
+        self._ready: asyncio.Queue[str] | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._pending = 0
+
+    def enqueue(self, route: str, send: Callable[[], Awaitable], coalesce_key: Hashable | None = None, on_failure: Callable[[Exception], Awaitable] | None = None) -> bool:
+        """Queues `send()` on `route`. Returns False if the queue is full and it was dropped."""
+        if coalesce_key is not None and coalesce_key in self._waiting:
+            job = self._waiting[coalesce_key]
+            job.send, job.on_failure = send, on_failure
+            self.coalesced += 1
+            return True
+        if self._pending >= self.max_pending:
+            self.dropped += 1
+            print(f"Outbound queue is full, dropped a message for {route}")
+            return False
+
+        self._start()
+        job = _Job(route, send, coalesce_key, on_failure)
+        if coalesce_key is not None:
+            self._waiting[coalesce_key] = job
+        self._pending += 1
+        if route in self._routes:
+            # A worker already owns this route and picks the job up after the ones before it
+            self._routes[route].append(job)
+        else:
+            self._routes[route] = deque([job])
+            self._ready.put_nowait(route)
+        return True
+
+    def _start(self):
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        self._tasks = [asyncio.get_running_loop().create_task(self._worker()) for _ in range(self.workers)]
+
+    async def _worker(self):
+        while True:
+            route = await self._ready.get()
+            jobs = self._routes[route]
+            job = jobs.popleft()
+            if job.coalesce_key is not None:
+                self._waiting.pop(job.coalesce_key, None)
+
+            budget = self._budgets.setdefault(route, _RateBudget(self.route_rate, self.route_per))
+            await budget.acquire()
+            await self._deliver(job)
+            self._pending -= 1
+
+            if jobs:
+                self._ready.put_nowait(route)
+            else:
+                del self._routes[route]
+                if budget.is_full():
+                    del self._budgets[route]
+
+    async def _deliver(self, job: _Job):
+        for attempt in range(self.max_attempts):
+            try:
+                await job.send()
+                self.sent += 1
+                self.latencies.append(time.monotonic() - job.enqueued_at)
+                return
+            except discord.HTTPException as e:
+                error = e
+                if e.status < 500 and e.status != 429:
+                    break
+            except (OSError, asyncio.TimeoutError) as e:
+                error = e
+            except Exception as e:
+                error = e
+                break
+            if attempt + 1 < self.max_attempts:
+                self.retries += 1
+                await asyncio.sleep(self.backoff * 2 ** attempt * random.uniform(0.8, 1.2))
+
+        self.failed += 1
+        print(f"Failed to send a message to {job.route}: {error}")
+        if job.on_failure:
+            try:
+                await job.on_failure(error)
+            except Exception as e:
+                print(f"Failure callback for {job.route} failed: {e}")
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+        percentile = lambda pct: latencies[min(len(latencies) - 1, int(len(latencies) * pct))] if latencies else 0.0
+        return {
+            "queued": self._pending,
+            "routes": len(self._routes),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "p50_ms": percentile(0.50) * 1000,
+            "p95_ms": percentile(0.95) * 1000,
+        }
+
+class Debouncer:
+    """
+    Runs `action(key)` at most once every `interval` seconds per key. Triggers that arrive
+    in between are folded into a single trailing run, so the last state always goes out.
+    """
+    def __init__(self, action: Callable[[Hashable], Awaitable], interval: float = 5.0):
+        self.action = action
+        self.interval = interval
+        self.runs = 0
+        self.folded = 0
+        self._scheduled: dict[Hashable, asyncio.TimerHandle] = {}
+        self._last_run: dict[Hashable, float] = {}
+
+    def trigger(self, key: Hashable):
+        if key in self._scheduled:
+            self.folded += 1
+            return
+        loop = asyncio.get_running_loop()
+        delay = max(0.0, self._last_run.get(key, float("-inf")) + self.interval - loop.time())
+        self._scheduled[key] = loop.call_later(delay, self._run, key)
+
+    def _run(self, key: Hashable):
+        loop = asyncio.get_running_loop()
+        del self._scheduled[key]
+        self._last_run[key] = loop.time()
+        # Forget keys that have been quiet for a while
+        for old_key in [k for k, ran in self._last_run.items() if ran + self.interval < loop.time()]:
+            del self._last_run[old_key]
+        self.runs += 1
+        loop.create_task(self._run_action(key))
+
+    async def _run_action(self, key: Hashable):
+        try:
+            await self.action(key)
+        except Exception as e:
+            print(f"Debounced action for {key} failed: {e}")
+
+dispatcher = OutboundDispatcher()
+
+def send_dm(client: discord.Client, user_id: int, content: str | None = None, embed: discord.Embed | None = None, coalesce_key: Hashable | None = None, on_failure: Callable[[Exception], Awaitable] | None = None, interaction: discord.Interaction | None = None) -> bool:
+    """
+    Queues a DM to a user. `coalesce_key` is scoped to the user. Pass the interaction being
+    handled, if any, so that the user can be taken from it instead of being fetched.
+    """
+    async def send():
+        user = await user_resolver.resolve(client, user_id, interaction)
+        await user.send(content=content, embed=embed)
+    key = None if coalesce_key is None else (user_id, coalesce_key)
+    return dispatcher.enqueue(f"dm:{user_id}", send, coalesce_key=key, on_failure=on_failure)
+
+def send_to_channel(channel: discord.abc.Messageable, content: str | None = None, embed: discord.Embed | None = None) -> bool:
+    """Queues a message to a channel; messages to one channel keep their order."""
+    async def send():
+        await channel.send(content=content, embed=embed)
+    return dispatcher.enqueue(f"channel:{channel.id}", send)
+
+def edit_message(message: discord.Message | discord.PartialMessage, coalesce_key: Hashable | None = None, **fields) -> bool:
+    """Queues an edit of a message on its channel's route."""
+    async def send():
+        await message.edit(**fields)
+    key = None if coalesce_key is None else (message.id, coalesce_key)
+    return dispatcher.enqueue(f"channel:{message.channel.id}", send, coalesce_key=key)
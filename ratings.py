@@ -0,0 +1,120 @@
+"""
+Glicko-style skill ratings. Every settled pick is a game against the market: the
+opponent's rating is set so that a gambler at the starting rating is expected to score
+exactly the outcome's implied probability, so a correct long shot is worth much more than
+a correct favourite, and a missed favourite costs more than a missed long shot. Each pick
+moves the rating by at most its uncertainty (deviation), which shrinks with every pick and
+drifts back up a little with every settled bet so that ratings keep moving.
+
+Gamblers never play each other, so their histories are independent. Picks are applied in
+rounds, the n-th pick of every gambler at once, which makes a full replay of the history
+a loop over the longest history with every step vectorized across gamblers.
+"""
+import math
+from dataclasses import dataclass
+
+import numpy as np
+from sqlalchemy.engine import Connection
+
+from analytics import implied_probabilities, rows
+from settings import Constant
+
+Q = math.log(10) / 400
+MIN_PROBABILITY = 0.01  # Keeps the market's rating finite for (near) certain outcomes
+
+def market_ratings(odds: np.ndarray, bet_on: np.ndarray) -> np.ndarray:
+    """The opponent rating of each pick: (n, 3) odds indexed by outcome and the (n,) outcomes picked."""
+    probability = implied_probabilities(odds)[np.arange(len(bet_on)), bet_on]
+    probability = probability.clip(MIN_PROBABILITY, 1 - MIN_PROBABILITY)
+    return Constant.RATING_START + 400 * np.log10((1 - probability) / probability)
+
+def update(rating: np.ndarray, deviation: np.ndarray, opponent: np.ndarray, score: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """One Glicko rating period with a single game against an opponent of known strength."""
+    deviation = np.minimum(np.sqrt(deviation ** 2 + Constant.RATING_DRIFT ** 2), Constant.RATING_START_DEVIATION)
+    expected = 1 / (1 + 10 ** ((opponent - rating) / 400))
+    precision = 1 / deviation ** 2 + Q ** 2 * expected * (1 - expected)
+    return rating + Q / precision * (score - expected), np.sqrt(1 / precision)
+
+@dataclass
+class RatedPicks:
+    gambler_ids: np.ndarray  # (n,) int64
+    sequence: np.ndarray  # (n,) int64 settlement order
+    opponent: np.ndarray  # (n,) float64 market rating of the pick
+    score: np.ndarray  # (n,) float64 1 if correct, 0 if not
+
+def rated_picks(gambler_ids, sequence, odds, bet_on, correct) -> RatedPicks:
+    return RatedPicks(
+        gambler_ids=np.asarray(gambler_ids, dtype=np.int64),
+        sequence=np.asarray(sequence, dtype=np.int64),
+        opponent=market_ratings(np.asarray(odds, dtype=np.float64).reshape(-1, 3), np.asarray(bet_on, dtype=np.intp)),
+        score=np.asarray(correct, dtype=np.float64),
+    )
+
+def apply(ratings: dict[int, tuple[float, float, int]], picks: RatedPicks) -> dict[int, tuple[float, float, int]]:
+    """
+    Applies `picks` on top of `ratings` (gambler_id -> (rating, deviation, rated picks)),
+    each gambler's picks in `sequence` order. Gamblers without a rating start from scratch.
+    Returns the new values of every gambler in `picks`.
+    """
+    gambler_ids, index = np.unique(picks.gambler_ids, return_inverse=True)
+    start = [ratings.get(int(gambler_id), (Constant.RATING_START, Constant.RATING_START_DEVIATION, 0)) for gambler_id in gambler_ids]
+    rating = np.array([value[0] for value in start], dtype=np.float64)
+    deviation = np.array([value[1] for value in start], dtype=np.float64)
+    rated = np.array([value[2] for value in start], dtype=np.int64) + np.bincount(index, minlength=len(gambler_ids))
+
+    # Round n holds the n-th pick of every gambler, so no gambler appears twice in a round
+    order = np.lexsort((picks.sequence, index))
+    first = np.searchsorted(index[order], index[order])
+    rounds = np.arange(len(order)) - first
+    by_round = order[np.argsort(rounds, kind="stable")]
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(rounds))])
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        pick = by_round[lo:hi]
+        who = index[pick]
+        rating[who], deviation[who] = update(rating[who], deviation[who], picks.opponent[pick], picks.score[pick])
+
+    return {int(gambler_id): (float(rating[i]), float(deviation[i]), int(rated[i])) for i, gambler_id in enumerate(gambler_ids)}
+
+def load_rated_picks(connection: Connection, gambler_ids: list[int] | None = None) -> RatedPicks:
+    """Every live settlement in the ledger, or those of `gambler_ids`, in settlement order."""
+    only = "" if gambler_ids is None else f"AND l.gambler_id IN ({', '.join('?' * len(gambler_ids))})"
+    picks = np.fromiter(
+        rows(
+            connection,
+            # A bet's live settlement is made of the rows appended after its last reversal. The
+            # bet, pick and result travel packed in one integer: fetching rows is the slow part.
+            "WITH reversed AS (SELECT bet_id, MAX(seq) AS seq FROM settlement_ledger WHERE total < 0 GROUP BY bet_id) "
+            "SELECT l.gambler_id, l.bet_id * 8 + l.bet_on * 2 + l.correct "
+            "FROM settlement_ledger l LEFT JOIN reversed r ON r.bet_id = l.bet_id "
+            f"WHERE l.total > 0 AND l.seq > COALESCE(r.seq, 0) {only} ORDER BY l.seq",
+            tuple(gambler_ids or ()),
+        ),
+        dtype=[("gambler", "i8"), ("packed", "i8")],
+    )
+    bets = np.fromiter(
+        rows(connection, "SELECT id, odd_0, odd_1, odd_2 FROM bets WHERE winning_odd IS NOT NULL ORDER BY id"),
+        dtype=[("id", "i8"), ("odd_0", "f8"), ("odd_1", "f8"), ("odd_2", "f8")],
+    )
+    bet = np.searchsorted(bets["id"], picks["packed"] >> 3)
+    odds = np.column_stack([bets["odd_0"], bets["odd_1"], bets["odd_2"]])[bet]
+    return rated_picks(picks["gambler"], np.arange(len(picks)), odds, (picks["packed"] >> 1) & 3, picks["packed"] & 1)
+
+def rebuild(connection: Connection, gambler_ids: list[int] | None = None) -> int:
+    """
+    Replays the ledger into the ratings table, for every gambler or only `gambler_ids`.
+    Returns how many gamblers were rated. Migration 10 calls this too, so the ratings of
+    an upgraded database always come from the current rating code.
+    """
+    if gambler_ids is not None and not gambler_ids:
+        return 0
+    values = apply({}, load_rated_picks(connection, gambler_ids))
+    if gambler_ids is None:
+        connection.exec_driver_sql("DELETE FROM ratings")
+    else:
+        connection.exec_driver_sql("DELETE FROM ratings WHERE gambler_id = ?", [(gambler_id,) for gambler_id in gambler_ids])
+    if values:
+        connection.exec_driver_sql(
+            "INSERT INTO ratings (gambler_id, rating, deviation, rated) VALUES (?, ?, ?, ?)",
+            [(gambler_id, *value) for gambler_id, value in values.items()],
+        )
+    return len(values)
@@ -6,6 +6,10 @@ class Paths():
 class Constant():
     ID_LENGTH = 8
     BET_OUTCOMES = [1,0,2]
+    LEADERBOARD_MIN_RATIO = 0.4  # Share of all bets a gambler must have played to be ranked globally
+    RATING_START = 1500.0
+    RATING_START_DEVIATION = 350.0  # Also the most uncertain a rating can get
+    RATING_DRIFT = 5.0  # Deviation regained per settled pick, so ratings never freeze
 
 class Fields():
     FOOTBALL = "Football"
@@ -0,0 +1,162 @@
+"""
+Monte Carlo outlook for a week that is still being played. The week's unsettled bets are
+drawn from the probabilities implied by their odds, and every gambler's final weekly payoff
+is scored for each scenario in one matrix product. Scenarios are split into chunks that run
+on a process pool, so neither the bot's event loop nor its DB thread does any of the work.
+"""
+import asyncio
+import contextlib
+import multiprocessing
+import os
+import sys
+import types
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+from sqlalchemy.engine import Connection
+
+from analytics import NO_PICK, implied_probabilities, rows
+
+@dataclass
+class WeekState:
+    week: int
+    gambler_ids: np.ndarray  # (g,) int64, sorted
+    names: list[str]  # (g,)
+    payoff: np.ndarray  # (g,) float64 weekly payoff of the settled bets so far
+    bet_ids: np.ndarray  # (m,) int64 the week's unsettled bets
+    picks: np.ndarray  # (g, m) int8: the outcome picked (1, 0 or 2) or NO_PICK
+    odds: np.ndarray  # (m, 3) float64: odds[:, outcome] is the odd of that outcome
+
+def load_week_state(connection: Connection, week: int) -> WeekState:
+    gamblers = connection.exec_driver_sql(
+        "SELECT g.id, g.name, COALESCE(w.payoff, 0) FROM gamblers g "
+        "LEFT JOIN weekly_statistics w ON w.gambler_id = g.id AND w.week_num = ? ORDER BY g.id",
+        (week,),
+    ).all()
+    gambler_ids = np.fromiter((row[0] for row in gamblers), dtype=np.int64, count=len(gamblers))
+
+    bets = np.fromiter(
+        rows(connection, "SELECT id, odd_0, odd_1, odd_2 FROM bets WHERE week = ? AND winning_odd IS NULL ORDER BY id", (week,)),
+        dtype=[("id", "i8"), ("odd_0", "f8"), ("odd_1", "f8"), ("odd_2", "f8")],
+    )
+    picked = np.fromiter(
+        rows(
+            connection,
+            "SELECT gb.gambler_id, gb.bet_id, gb.bet_on FROM gambler_bet gb "
+            "JOIN bets b ON b.id = gb.bet_id WHERE b.week = ? AND b.winning_odd IS NULL",
+            (week,),
+        ),
+        dtype=[("gambler", "i8"), ("bet", "i8"), ("bet_on", "i1")],
+    )
+    picks = np.full((len(gambler_ids), len(bets)), NO_PICK, dtype=np.int8)
+    picks[np.searchsorted(gambler_ids, picked["gambler"]), np.searchsorted(bets["id"], picked["bet"])] = picked["bet_on"]
+
+    return WeekState(
+        week=week,
+        gambler_ids=gambler_ids,
+        names=[row[1] for row in gamblers],
+        payoff=np.fromiter((row[2] for row in gamblers), dtype=np.float64, count=len(gamblers)),
+        bet_ids=bets["id"],
+        picks=picks,
+        odds=np.column_stack([bets["odd_0"], bets["odd_1"], bets["odd_2"]]),
+    )
+
+@dataclass
+class Outlook:
+    scenarios: int
+    top1: np.ndarray  # (g,) probability of finishing first (ties included)
+    top3: np.ndarray  # (g,) probability of finishing in the top three (ties included)
+
+def _gains(picks: np.ndarray, odds: np.ndarray) -> np.ndarray:
+    # (m * 3, g) payoff change in cents for each bet and outcome; cents keep the sums exact, so ties stay ties
+    won = np.rint((odds - 1) * 100)  # (m, 3)
+    gains = np.zeros((picks.shape[1], 3, picks.shape[0]))
+    for outcome in range(3):
+        gains[:, outcome, :] = np.where(picks.T == outcome, won[:, outcome, None], np.where(picks.T == NO_PICK, 0.0, -100.0))
+    return gains.reshape(-1, picks.shape[0])
+
+def _simulate_chunk(payoff: np.ndarray, picks: np.ndarray, odds: np.ndarray, scenarios: int, seed: np.random.SeedSequence, block: int = 4096) -> tuple[np.ndarray, np.ndarray]:
+    """Counts how often each gambler ends up first and in the top three. Runs in a worker process."""
+    rng = np.random.default_rng(seed)
+    gamblers, bets = picks.shape
+    cdf = np.cumsum(implied_probabilities(odds), axis=1)[:, :2]  # (m, 2)
+    gains = _gains(picks, odds)
+    base = np.rint(payoff * 100)
+    offsets = np.arange(bets) * 3
+    podium = min(3, gamblers)
+    top1 = np.zeros(gamblers, dtype=np.int64)
+    top3 = np.zeros(gamblers, dtype=np.int64)
+
+    for start in range(0, scenarios, block):
+        size = min(block, scenarios - start)
+        # Inverse-CDF draw of every bet's outcome, then one-hot over (bet, outcome) columns
+        outcomes = (rng.random((size, bets, 1)) > cdf).sum(axis=2)
+        onehot = np.zeros((size, bets * 3))
+        onehot[np.arange(size)[:, None], offsets + outcomes] = 1.0
+        scores = base + onehot @ gains  # (size, g)
+
+        # Competition ranking like RANK(): everyone level with the n-th best score is in the top n
+        first = scores.max(axis=1, keepdims=True)
+        third = np.partition(scores, gamblers - podium, axis=1)[:, gamblers - podium, None]
+        top1 += (scores >= first).sum(axis=0)
+        top3 += (scores >= third).sum(axis=0)
+    return top1, top3
+
+_process_pool: ProcessPoolExecutor | None = None
+
+def _workers() -> int:
+    return int(os.getenv("SIM_WORKERS", os.cpu_count() or 1))
+
+def process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        # Never fork: the bot has an event loop, the DB thread and open connections that a
+        # forked child would inherit mid-use. Workers start clean with only this module
+        # imported (see _without_main); the fork server is preloaded with it.
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        context = multiprocessing.get_context(method)
+        if method == "forkserver":
+            context.set_forkserver_preload([__name__])
+        _process_pool = ProcessPoolExecutor(max_workers=_workers(), mp_context=context)
+    return _process_pool
+
+@contextlib.contextmanager
+def _without_main():
+    # A spawned or fork server worker re-imports the parent's __main__ as __mp_main__, which
+    # for the bot means the command tree and the DB bootstrap with its migrations. A main
+    # module without a file or spec is left alone, so it stands in while workers start.
+    # Workers are started by submit(), synchronously in the calling thread.
+    main = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+def shutdown():
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+
+async def simulate_week(state: WeekState, scenarios: int = 100_000, seed: int | None = None) -> Outlook:
+    """Splits `scenarios` over the process pool and awaits the combined top-1/top-3 probabilities."""
+    if len(state.gambler_ids) == 0:
+        return Outlook(0, np.zeros(0), np.zeros(0))
+    if len(state.bet_ids) == 0:
+        # Nothing left to play: the current standings are final
+        top1, top3 = _simulate_chunk(state.payoff, state.picks, state.odds, 1, np.random.SeedSequence(seed))
+        return Outlook(1, top1.astype(np.float64), top3.astype(np.float64))
+
+    pool = process_pool()
+    chunks = max(1, min(_workers() * 2, scenarios // 4096))
+    sizes = [scenarios // chunks + (i < scenarios % chunks) for i in range(chunks)]
+    loop = asyncio.get_running_loop()
+    with _without_main():
+        futures = [
+            loop.run_in_executor(pool, _simulate_chunk, state.payoff, state.picks, state.odds, size, child)
+            for size, child in zip(sizes, np.random.SeedSequence(seed).spawn(chunks))
+        ]
+    results = await asyncio.gather(*futures)
+    top1 = sum(result[0] for result in results)
+    top3 = sum(result[1] for result in results)
+    return Outlook(scenarios, top1 / scenarios, top3 / scenarios)
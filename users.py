@@ -0,0 +1,48 @@
+import discord
+
+from cache import LRUCache
+
+class UserResolver:
+    """
+    Resolves Discord user IDs without a REST call whenever possible: from the interaction
+    that is being handled, then the gateway's user cache, then an LRU of users fetched
+    before. Only a miss on all three calls fetch_user. Counts where each lookup was served
+    from, so the REST calls it saved can be reported.
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0):
+        self.cache = LRUCache("users", maxsize, ttl)
+        self.from_interaction = 0
+        self.from_gateway = 0
+        self.from_cache = 0
+        self.from_rest = 0
+
+    async def resolve(self, client: discord.Client, user_id: int, interaction: discord.Interaction | None = None) -> discord.abc.User:
+        if interaction is not None and interaction.user.id == user_id:
+            self.from_interaction += 1
+            return interaction.user
+
+        user = client.get_user(user_id)
+        if user is not None:
+            self.from_gateway += 1
+            return user
+
+        user = self.cache.get(user_id)
+        if user is not None:
+            self.from_cache += 1
+            return user
+
+        user = await client.fetch_user(user_id)
+        self.from_rest += 1
+        self.cache.put(user_id, user)
+        return user
+
+    def stats(self) -> dict:
+        return {
+            "interaction": self.from_interaction,
+            "gateway": self.from_gateway,
+            "cache": self.from_cache,
+            "rest": self.from_rest,
+            "rest_avoided": self.from_interaction + self.from_gateway + self.from_cache,
+        }
+
+user_resolver = UserResolver()